@@ -0,0 +1,86 @@
+import hashlib
+import os
+import re
+from cache import TTLCache
+
+ANSWER_CACHE_MAXSIZE = int(os.getenv("ANSWER_CACHE_MAXSIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Общий кэш для нескольких воркеров, например redis://localhost:6379/0
+ANSWER_CACHE_REDIS_URL = os.getenv("ANSWER_CACHE_REDIS_URL")
+
+KEY_PREFIX = "ask-ai"
+
+
+def normalize_question(question: str) -> str:
+    text = question.lower().replace("ё", "е")
+    text = re.sub(r'[^\w\s]|_', ' ', text)
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """Кэш ответов ассистента: вопрос + статья + ее версия (updated_at)"""
+
+    def __init__(self, maxsize=2048, ttl=3600.0, redis_url=None):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(redis_url, decode_responses=True)
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    @staticmethod
+    def make_key(question: str, article) -> str:
+        digest = hashlib.sha1(normalize_question(question).encode()).hexdigest()
+        revision = article["updated_at"].isoformat() if article.get("updated_at") else "-"
+        return f"{KEY_PREFIX}:{article['id']}:{revision}:{digest}"
+
+    async def get(self, question: str, article):
+        key = self.make_key(question, article)
+        answer = self.local.get(key)
+        if answer is None and self.redis is not None:
+            answer = await self.redis.get(key)
+            if answer is not None:
+                self.local.set(key, answer)
+        if answer is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return answer
+
+    async def set(self, question: str, article, answer: str):
+        key = self.make_key(question, article)
+        self.local.set(key, answer)
+        if self.redis is not None:
+            await self.redis.set(key, answer, ex=int(self.ttl))
+
+    async def invalidate_article(self, article_id: int):
+        prefix = f"{KEY_PREFIX}:{article_id}:"
+        removed = self.local.delete_prefix(prefix)
+        if self.redis is not None:
+            async for key in self.redis.scan_iter(match=f"{prefix}*"):
+                await self.redis.delete(key)
+                removed += 1
+        self._invalidated += removed
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            "backend": "redis" if self.redis is not None else "memory",
+            "size": self.local.stats()["size"],
+            "maxsize": self.local.maxsize,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "invalidated": self._invalidated,
+        }
+
+
+answer_cache = AnswerCache(
+    maxsize=ANSWER_CACHE_MAXSIZE,
+    ttl=ANSWER_CACHE_TTL,
+    redis_url=ANSWER_CACHE_REDIS_URL,
+)
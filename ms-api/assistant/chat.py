@@ -1,86 +1,167 @@
-import openai
-import os
-from .models import find_article_by_question
-from dotenv import load_dotenv
+from text_utils import count_tokens
+from .answer_cache import answer_cache
+from .hybrid_search import find_article
+from .llm import llm_gateway
+from .models import extract_medical_terms
+from .prompt_budget import pack_chunks, prompt_stats
 
-# Загружаем переменные окружения
-load_dotenv()
+# Сколько лучших фрагментов статьи рассматриваем при упаковке в бюджет
+CHUNK_CANDIDATES = 40
 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+NOT_FOUND_MESSAGE = "К сожалению, не удалось найти подходящую статью по вашему вопросу."
 
-def answer_user_question(question: str, db_conn):
-    print(f"Ищем статью для вопроса: {question}")
 
-    try:
-        article = find_article_by_question(question, db_conn)
-        print(f"Найденная статья: {article}")
+def article_url(article) -> str:
+    return f"http://localhost:8000/articles/{article['id']}/full"
 
-        if not article:
-            return "К сожалению, не удалось найти подходящую статью по вашему вопросу."
 
-        # Формируем ссылку на статью
-        article_url = f"http://localhost:8000/articles/{article['id']}/full"
+def build_article_content(title: str, chunks) -> str:
+    """Собирает текст статьи из выбранных фрагментов, сгруппированных по разделам"""
+    article_content = f"Статья: {title}\n\n"
+    current_section = None
 
-        # Получаем только релевантные разделы
-        cursor = db_conn.cursor()
-        cursor.execute("""
-                       SELECT section_title, html_content
-                       FROM article_sections
-                       WHERE article_id = %s
-                       ORDER BY id LIMIT 3
-                       """, (article['id'],))
+    for chunk in chunks:
+        if chunk['section_id'] != current_section:
+            if current_section is not None:
+                article_content += "\n"
+            article_content += f"Раздел: {chunk['section_title']}\n"
+            current_section = chunk['section_id']
+        article_content += f"{chunk['content']}\n"
 
-        sections = cursor.fetchall()
-        cursor.close()
+    return article_content
 
-        if not sections:
-            return f"Найдена статья '{article['title']}', но её содержимое недоступно.\nСсылка: {article_url}"
 
-        # Формируем сокращенный контент
-        article_content = f"Статья: {article['title']}\n\n"
-        total_chars = 0
-        MAX_CHARS = 3000
+def build_prompt(question: str, article_content: str) -> str:
+    return f"""Ответь кратко на русском языке на основе статьи:
 
-        for section in sections:
-            from bs4 import BeautifulSoup
-            clean_text = BeautifulSoup(section['html_content'], 'html.parser').get_text()
+{article_content}
 
-            if len(clean_text) > 1000:
-                clean_text = clean_text[:1000] + "..."
+Вопрос: {question}
 
-            section_text = f"Раздел: {section['section_title']}\n{clean_text}\n\n"
+Ответ:"""
 
-            if total_chars + len(section_text) > MAX_CHARS:
-                break
 
-            article_content += section_text
-            total_chars += len(section_text)
+def prepare_prompt(question: str, article, chunks):
+    """Промпт по выбранным фрагментам и его длина в токенах"""
+    prompt = build_prompt(question, build_article_content(article['title'], chunks))
+    prompt_tokens = count_tokens(prompt)
+    prompt_stats.record(prompt_tokens)
+    return prompt, prompt_tokens
 
-        prompt = f"""Ответь кратко на русском языке на основе статьи:
 
-{article_content}
+def format_answer(answer_text: str, article) -> str:
+    # Добавляем ссылку к ответу
+    return f"{answer_text}\n\n[Подробнее: {article['title']}]({article_url(article)})"
 
-Вопрос: {question}
 
-Ответ:"""
+def unavailable_message(article) -> str:
+    return f"Найдена статья '{article['title']}', но её содержимое недоступно.\nСсылка: {article_url(article)}"
+
+
+async def retrieve_context(question: str, db_pool):
+    """Статья, ответ из кэша (если есть) и фрагменты статьи для промпта"""
+    print(f"Ищем статью для вопроса: {question}")
+
+    # Соединение берем только на время запросов к БД, а не на весь вызов LLM
+    async with db_pool.acquire() as conn:
+        article = await find_article(question, conn)
+        print(f"Найденная статья: {article}")
+
+        if not article:
+            return None, None, []
+
+        cached_answer = await answer_cache.get(question, article)
+        if cached_answer is not None:
+            print("Ответ взят из кэша")
+            return article, cached_answer, []
+
+        # Фрагменты статьи по релевантности вопросу; без совпадений - в порядке чтения
+        terms = extract_medical_terms(question)
+        chunks = await conn.fetch("""
+                                  SELECT c.section_id, c.chunk_index, c.content, c.token_count, s.section_title,
+                                         ts_rank(c.search_vector, q.query)
+                                             + 0.5 * ts_rank(to_tsvector('russian', s.section_title), q.query) AS score
+                                  FROM article_section_chunks c
+                                  JOIN article_sections s ON s.id = c.section_id
+                                  CROSS JOIN (SELECT to_tsquery('russian', $2) AS query) q
+                                  WHERE c.article_id = $1
+                                  ORDER BY score DESC, c.section_id, c.chunk_index
+                                  LIMIT $3
+                                  """, article['id'], " | ".join(terms), CHUNK_CANDIDATES)
+
+    return article, None, pack_chunks(chunks)
+
+
+async def answer_user_question(question: str, db_pool):
+    try:
+        article, cached_answer, chunks = await retrieve_context(question, db_pool)
+
+        if not article:
+            return NOT_FOUND_MESSAGE
 
-        print(f"Отправляем запрос к OpenAI (длина: {len(article_content)} символов)")
+        if cached_answer is not None:
+            return format_answer(cached_answer, article)
 
-        response = client.chat.completions.create(
+        if not chunks:
+            return unavailable_message(article)
+
+        prompt, prompt_tokens = prepare_prompt(question, article, chunks)
+        print(f"Отправляем запрос к OpenAI (промпт: {prompt_tokens} токенов)")
+
+        answer_text = await llm_gateway.complete(
+            [{"role": "user", "content": prompt}],
             model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
             max_tokens=256,
-            temperature=0.3,
-            timeout=30
+            temperature=0.3
         )
-
-        answer_text = response.choices[0].message.content
-
-        # Добавляем ссылку к ответу
-        return f"{answer_text}\n\n[Подробнее: {article['title']}]({article_url})"
+        await answer_cache.set(question, article, answer_text)
+        return format_answer(answer_text, article)
 
     except Exception as e:
         print(f"Ошибка в answer_user_question: {e}")
         import traceback
         traceback.print_exc()
-        return f"Произошла ошибка при обработке запроса: {str(e)}"
\ No newline at end of file
+        return f"Произошла ошибка при обработке запроса: {str(e)}"
+
+
+async def stream_user_answer(question: str, db_pool):
+    """Потоковый ответ: пары (событие, данные) - article, token..., done или error"""
+    try:
+        article, cached_answer, chunks = await retrieve_context(question, db_pool)
+
+        if not article:
+            yield "done", {"answer": NOT_FOUND_MESSAGE}
+            return
+
+        # Ссылку на статью отдаем сразу, до обращения к OpenAI
+        yield "article", {"id": article['id'], "title": article['title'], "url": article_url(article)}
+
+        if cached_answer is not None:
+            yield "token", {"text": cached_answer}
+            yield "done", {"answer": format_answer(cached_answer, article), "cached": True}
+            return
+
+        if not chunks:
+            yield "done", {"answer": unavailable_message(article)}
+            return
+
+        prompt, prompt_tokens = prepare_prompt(question, article, chunks)
+        print(f"Отправляем потоковый запрос к OpenAI (промпт: {prompt_tokens} токенов)")
+
+        parts = []
+        async for delta in llm_gateway.stream(
+            [{"role": "user", "content": prompt}],
+            model="gpt-4o-mini",
+            max_tokens=256,
+            temperature=0.3
+        ):
+            parts.append(delta)
+            yield "token", {"text": delta}
+
+        answer_text = "".join(parts)
+        await answer_cache.set(question, article, answer_text)
+        yield "done", {"answer": format_answer(answer_text, article), "prompt_tokens": prompt_tokens}
+
+    except Exception as e:
+        print(f"Ошибка в stream_user_answer: {e}")
+        yield "error", {"detail": str(e)}
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+# Файл кэша лежит отдельно от ./chroma_db, чтобы пересборка индекса его не затрагивала
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+
+
+class EmbeddingCache:
+    """Постоянный кэш эмбеддингов: sha256(модель + текст) -> вектор float32"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+        return self._conn
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: List[str], model: str) -> Dict[str, List[float]]:
+        keys = {self.make_key(text, model): text for text in texts}
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            key_list = list(keys)
+            # SQLite ограничивает число параметров в запросе
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = array("f", blob).tolist()
+            self._hits += len(found)
+            self._misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]], model: str):
+        now = time.time()
+        rows = [
+            (self.make_key(text, model), model, len(vector), array("f", vector).tobytes(), now)
+            for text, vector in items.items()
+        ]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._connection().execute("SELECT count(*) FROM embeddings").fetchone()[0]
+            lookups = self._hits + self._misses
+            return {
+                "path": self.path,
+                "entries": size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from collections import deque
+from .models import find_articles_by_question
+from .vector_search import vector_search
+
+# Гибридный поиск включается переменной окружения ASSISTANT_HYBRID_SEARCH=1
+HYBRID_SEARCH_ENABLED = os.getenv("ASSISTANT_HYBRID_SEARCH", "0") == "1"
+# Сколько кандидатов берем из каждого поиска перед слиянием
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Константа k в reciprocal rank fusion: 1 / (k + место)
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Сколько ждем векторный поиск (сек); не успел - отвечаем по полнотекстовому
+HYBRID_VECTOR_TIMEOUT = float(os.getenv("HYBRID_VECTOR_TIMEOUT", "2"))
+
+STAGES = ("lexical", "vector", "fusion", "total")
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Сумма 1 / (k + место) по всем спискам: id -> (score, {имя списка: место})"""
+    fused = {}
+    for name, ids in rankings.items():
+        for rank, article_id in enumerate(ids, start=1):
+            score, ranks = fused.get(article_id, (0.0, {}))
+            ranks[name] = rank
+            fused[article_id] = (score + 1.0 / (k + rank), ranks)
+    return fused
+
+
+class RetrievalStats:
+    """Задержки этапов поиска по последним запросам"""
+
+    def __init__(self, window=1000):
+        self._timings = deque(maxlen=window)
+        self._vector_timeouts = 0
+        self._vector_errors = 0
+
+    def record(self, timings):
+        self._timings.append(timings)
+
+    def vector_timeout(self):
+        self._vector_timeouts += 1
+
+    def vector_error(self):
+        self._vector_errors += 1
+
+    def stats(self):
+        timings = list(self._timings)  # копия: deque дополняется из hybrid_search
+        result = {
+            "requests": len(timings),
+            "vector_timeouts": self._vector_timeouts,
+            "vector_errors": self._vector_errors,
+        }
+        for stage in STAGES:
+            values = sorted(t[stage] for t in timings if t.get(stage) is not None)
+            if not values:
+                result[stage] = None
+                continue
+            result[stage] = {
+                "avg_ms": round(sum(values) / len(values), 3),
+                "p50_ms": values[len(values) // 2],
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max_ms": values[-1],
+            }
+        return result
+
+
+retrieval_stats = RetrievalStats()
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+async def _timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, _elapsed_ms(started)
+
+
+async def _vector_candidates(question, limit):
+    # Клиент OpenAI и бэкенд векторов синхронные - уводим их в поток
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(vector_search.search_articles, question, limit),
+            HYBRID_VECTOR_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        retrieval_stats.vector_timeout()
+        print(f"⚠️ Векторный поиск не уложился в {HYBRID_VECTOR_TIMEOUT} сек")
+        return []
+    except Exception as e:
+        retrieval_stats.vector_error()
+        print(f"Ошибка векторного поиска: {e}")
+        return []
+
+
+async def hybrid_search(question: str, db_conn, limit: int = 5):
+    """Полнотекстовый и векторный поиск параллельно, слияние через RRF.
+
+    Возвращает статьи (id, title, updated_at, score, lexical_rank, vector_rank)
+    и время этапов в миллисекундах.
+    """
+    started = time.perf_counter()
+
+    (lexical, lexical_ms), (vector, vector_ms) = await asyncio.gather(
+        _timed(find_articles_by_question(question, db_conn, limit=HYBRID_CANDIDATES)),
+        _timed(_vector_candidates(question, HYBRID_CANDIDATES)),
+    )
+
+    fusion_started = time.perf_counter()
+    fused = reciprocal_rank_fusion({
+        "lexical": [article["id"] for article in lexical],
+        "vector": [article["id"] for article in vector],
+    })
+    ranked = sorted(fused.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+
+    # updated_at нужен для ключа кэша ответов, а в метаданных векторов его нет
+    known = {article["id"]: article for article in lexical}
+    missing = [article_id for article_id, _ in ranked if article_id not in known]
+    if missing:
+        rows = await db_conn.fetch("""
+                                   SELECT id, title, COALESCE(updated_at, created_at) AS updated_at
+                                   FROM articles
+                                   WHERE id = ANY($1::int[])
+                                   """, missing)
+        known.update({row["id"]: row for row in rows})
+
+    articles = [
+        {
+            "id": article_id,
+            "title": known[article_id]["title"],
+            "updated_at": known[article_id]["updated_at"],
+            "score": score,
+            "lexical_rank": ranks.get("lexical"),
+            "vector_rank": ranks.get("vector"),
+        }
+        for article_id, (score, ranks) in ranked
+        if article_id in known
+    ]
+    fusion_ms = _elapsed_ms(fusion_started)
+
+    timings = {"lexical": lexical_ms, "vector": vector_ms, "fusion": fusion_ms, "total": _elapsed_ms(started)}
+    retrieval_stats.record(timings)
+    print(f"Гибридный поиск: {[(a['id'], a['title'], round(a['score'], 4)) for a in articles]}, {timings}")
+    return articles, timings
+
+
+async def find_article(question: str, db_conn):
+    """Лучшая статья: гибридным поиском, если он включен, иначе полнотекстовым"""
+    if HYBRID_SEARCH_ENABLED:
+        articles, _ = await hybrid_search(question, db_conn, limit=1)
+    else:
+        articles = await find_articles_by_question(question, db_conn, limit=1)
+    return articles[0] if articles else None
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Общий дедлайн вызова (сек): ожидание слота, все попытки и паузы между ними
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+
+# 429, 5xx и сетевые ошибки имеет смысл повторить, остальные (400, 401, ...) - нет
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # включает APITimeoutError
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    """Вызов LLM не уложился в отведенное время"""
+
+
+class LLMGateway:
+    """Общая точка вызова OpenAI: лимит параллельности, ретраи с backoff и объединение одинаковых запросов"""
+
+    def __init__(self, client, max_concurrency=16, max_retries=3, backoff_base=0.5, backoff_max=8.0, deadline=45.0):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}  # ключ запроса -> задача, результат которой ждут все одинаковые вызовы
+        self._active = 0
+
+        self._calls = 0
+        self._coalesced = 0
+        self._retries = 0
+        self._failures = 0
+
+    @staticmethod
+    def _request_key(**request):
+        payload = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _backoff_delay(self, attempt, error):
+        # Full jitter: случайная пауза от 0 до base * 2^attempt
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def _acquire_slot(self, deadline_at):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("Истекло время ожидания ответа LLM")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise LLMDeadlineExceeded("Нет свободного слота для запроса к LLM")
+        self._active += 1
+
+    def _release_slot(self):
+        self._active -= 1
+        self._semaphore.release()
+
+    async def _with_retries(self, call, deadline_at, hold_slot=False):
+        """hold_slot=True оставляет слот занятым после успеха - его освобождает вызывающий"""
+        attempt = 0
+        while True:
+            await self._acquire_slot(deadline_at)
+            succeeded = False
+            try:
+                result = await call(max(deadline_at - time.monotonic(), 0.001))
+                succeeded = True
+                return result
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                delay = self._backoff_delay(attempt, e)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline_at:
+                    self._failures += 1
+                    raise
+                self._retries += 1
+                print(f"Ошибка LLM ({type(e).__name__}), повтор {attempt}/{self.max_retries} через {delay:.2f} сек")
+            except Exception:
+                self._failures += 1
+                raise
+            finally:
+                if not (succeeded and hold_slot):
+                    self._release_slot()
+            await asyncio.sleep(delay)
+
+    async def complete(self, messages, model="gpt-4o-mini", max_tokens=256, temperature=0.3, deadline=None):
+        """Текст ответа; одинаковые одновременные запросы выполняются один раз"""
+        self._calls += 1
+        request = {"messages": messages, "model": model, "max_tokens": max_tokens, "temperature": temperature}
+        key = self._request_key(**request)
+
+        task = self._inflight.get(key)
+        if task is None:
+            deadline_at = time.monotonic() + (deadline or self.deadline)
+
+            async def call(timeout):
+                response = await self.client.chat.completions.create(**request, timeout=timeout)
+                return response.choices[0].message.content
+
+            task = asyncio.ensure_future(self._with_retries(call, deadline_at))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._coalesced += 1
+
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    async def stream(self, messages, model="gpt-4o-mini", max_tokens=256, temperature=0.3, deadline=None):
+        """Фрагменты ответа по мере генерации; повторяется только открытие потока"""
+        self._calls += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+
+        async def call(timeout):
+            return await self.client.chat.completions.create(
+                messages=messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                timeout=timeout, stream=True
+            )
+
+        # Слот занят все время, пока идет генерация
+        stream = await self._with_retries(call, deadline_at, hold_slot=True)
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            self._release_slot()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "in_flight_unique": len(self._inflight),
+            "calls": self._calls,
+            "coalesced": self._coalesced,
+            "retries": self._retries,
+            "failures": self._failures,
+        }
+
+
+# Ретраи делает шлюз, поэтому встроенные повторы клиента отключены
+llm_gateway = LLMGateway(
+    openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0),
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_max=LLM_BACKOFF_MAX,
+    deadline=LLM_DEADLINE,
+)
@@ -1,49 +1,65 @@
 import re
+from .title_index import title_index
 
+STOP_WORDS = {"как", "что", "где", "когда", "почему", "зачем", "ответь", "на", "русском", "языке", "по", "вылечить"}
 
-def find_article_by_question(question: str, db_conn):
-    cursor = db_conn.cursor()
+# Веса совпадения термина в заголовке и в коде МКБ
+TITLE_MATCH_WEIGHT = 1.0
+MKB_MATCH_WEIGHT = 0.5
 
-    # Медицинские термины имеют приоритет
-    medical_terms = []
-    stop_words = {"как", "что", "где", "когда", "почему", "зачем", "ответь", "на", "русском", "языке", "по", "вылечить"}
 
+def extract_medical_terms(question: str):
     # Очищаем от знаков препинания и разбиваем на слова
-    clean_question = re.sub(r'[^\w\s]', ' ', question.lower())
+    clean_question = re.sub(r'[^\w\s]|_', ' ', question.lower())
     words = clean_question.split()
 
+    terms = []
     for word in words:
-        if word not in stop_words and len(word) > 2:  # исключаем короткие слова
-            medical_terms.append(word)
-
-    # Ищем по медицинским терминам
-    for term in medical_terms:
-        print(f"Поиск по медицинскому термину: '{term}'")
-
-        cursor.execute("""
-                       SELECT id, title
-                       FROM articles
-                       WHERE LOWER(title) LIKE %s
-                          OR LOWER(mkb) LIKE %s LIMIT 1
-                       """, (f"%{term}%", f"%{term}%"))
-
-        row = cursor.fetchone()
-        print(f"Результат поиска: {row}")
-
-        if row:
-            try:
-                # Поддерживаем и RealDictRow и обычные кортежи
-                if hasattr(row, 'get'):  # RealDictRow
-                    article_id = row['id']
-                    article_title = row['title']
-                else:  # Обычный кортеж
-                    article_id = row[0]
-                    article_title = row[1]
-
-                cursor.close()
-                return {"id": article_id, "title": article_title}
-            except (KeyError, IndexError):
-                continue
-
-    cursor.close()
-    return None
\ No newline at end of file
+        if word not in STOP_WORDS and len(word) > 2 and word not in terms:  # исключаем короткие слова
+            terms.append(word)
+    return terms
+
+
+async def find_articles_by_question(question: str, db_conn, limit: int = 5):
+    """Ранжированный список статей по всем терминам вопроса одним запросом"""
+    terms = extract_medical_terms(question)
+    print(f"Поиск по медицинским терминам: {terms}")
+    if not terms:
+        return []
+
+    # Индекс в памяти отвечает без похода в БД; если он пуст или ничего не нашел - идем в БД
+    if title_index.ready:
+        articles = title_index.search(terms, limit, TITLE_MATCH_WEIGHT, MKB_MATCH_WEIGHT)
+        if articles:
+            print(f"Результат поиска (индекс в памяти): {[(a['id'], a['title'], a['score']) for a in articles]}")
+            return articles
+
+    # Каждый термин: совпадение в заголовке/МКБ по подстроке (триграммы) + полнотекстовый ранг
+    rows = await db_conn.fetch("""
+                               SELECT a.id,
+                                      a.title,
+                                      COALESCE(a.updated_at, a.created_at) AS updated_at,
+                                      (SELECT count(*) FROM unnest($2::text[]) p WHERE a.title ILIKE p) * $4::float8
+                                    + (SELECT count(*) FROM unnest($2::text[]) p WHERE a.mkb ILIKE p) * $5::float8
+                                    + ts_rank(a.search_vector, q.query) AS score
+                               FROM articles a,
+                                    to_tsquery('russian', $1) AS q(query)
+                               WHERE a.search_vector @@ q.query
+                                  OR a.title ILIKE ANY ($2::text[])
+                                  OR a.mkb ILIKE ANY ($2::text[])
+                               ORDER BY score DESC, a.id
+                               LIMIT $3
+                               """,
+                               " | ".join(terms), [f"%{term}%" for term in terms], limit,
+                               TITLE_MATCH_WEIGHT, MKB_MATCH_WEIGHT)
+    print(f"Результат поиска: {[(row['id'], row['title'], round(row['score'], 3)) for row in rows]}")
+
+    return [
+        {"id": row['id'], "title": row['title'], "updated_at": row['updated_at'], "score": row['score']}
+        for row in rows
+    ]
+
+
+async def find_article_by_question(question: str, db_conn):
+    articles = await find_articles_by_question(question, db_conn, limit=1)
+    return articles[0] if articles else None
@@ -1,12 +1,10 @@
-import os
-import openai
+from .llm import llm_gateway
 
-def ask_chatgpt(prompt):
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    response = client.chat.completions.create(
+
+async def ask_chatgpt(prompt):
+    return await llm_gateway.complete(
+        [{"role": "user", "content": prompt}],
         model="gpt-4-1106-preview",
-        messages=[{"role": "user", "content": prompt}],
         max_tokens=512,
         temperature=0.7,
     )
-    return response.choices[0].message.content
\ No newline at end of file
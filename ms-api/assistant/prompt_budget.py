@@ -0,0 +1,94 @@
+import os
+import re
+from text_utils import count_tokens, tokenizer_name, trim_to_tokens
+
+# Бюджет токенов на текст статьи в промпте
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "900"))
+# Меньше этого остатка бюджета фрагмент не обрезаем, а пропускаем
+MIN_TRIMMED_TOKENS = 40
+# Повторы убираем только у длинных строк: короткие ("нет.", подзаголовки) значимы в своем месте
+MIN_DEDUP_CHARS = 60
+
+# Строки-ссылки на источники вида "[2,3,5,6,7,9,10]" ничего не дают модели
+REFERENCE_LINE = re.compile(r'^[\[\(]?[\d\s,.\-–]+[\]\)]?$')
+REFERENCE_PREFIX = re.compile(r'^\[[\d\s,\-–]+\]\s*')
+
+
+def _line_key(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def compress_text(text: str, seen: set, section_title: str = "") -> str:
+    """Убирает строки-ссылки, повтор заголовка раздела и строки, уже попавшие в промпт"""
+    title_key = _line_key(section_title)
+    seen = set(seen)
+    lines = []
+    for line in (text or "").splitlines():
+        line = REFERENCE_PREFIX.sub("", line).strip()
+        key = _line_key(line)
+        if not key or REFERENCE_LINE.match(key) or key == title_key or key in seen:
+            continue
+        if len(key) >= MIN_DEDUP_CHARS:
+            seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def pack_chunks(chunks, budget: int = PROMPT_CONTEXT_TOKENS):
+    """Фрагменты в порядке релевантности -> сжатые фрагменты в бюджете, в порядке чтения статьи.
+
+    Последний не поместившийся фрагмент обрезается по границе предложения.
+    """
+    selected = []
+    seen = set()
+    used = 0
+
+    for chunk in chunks:
+        remaining = budget - used
+        if remaining <= 0:
+            break
+
+        content = compress_text(chunk['content'], seen, chunk['section_title'])
+        if not content:
+            continue
+        tokens = count_tokens(content)
+        if tokens > remaining:
+            if remaining < MIN_TRIMMED_TOKENS:
+                continue
+            content = trim_to_tokens(content, remaining)
+            if not content:
+                continue
+            tokens = count_tokens(content)
+
+        seen.update(key for key in map(_line_key, content.splitlines()) if len(key) >= MIN_DEDUP_CHARS)
+        selected.append({**chunk, 'content': content, 'token_count': tokens})
+        used += tokens
+
+    return sorted(selected, key=lambda chunk: (chunk['section_id'], chunk['chunk_index']))
+
+
+class PromptStats:
+    """Сколько токенов уходит в промпт"""
+
+    def __init__(self):
+        self._requests = 0
+        self._total = 0
+        self._max = 0
+
+    def record(self, prompt_tokens: int):
+        self._requests += 1
+        self._total += prompt_tokens
+        self._max = max(self._max, prompt_tokens)
+
+    def stats(self):
+        return {
+            "context_budget": PROMPT_CONTEXT_TOKENS,
+            "tokenizer": tokenizer_name(),
+            "requests": self._requests,
+            "prompt_tokens_total": self._total,
+            "prompt_tokens_avg": round(self._total / self._requests, 1) if self._requests else 0.0,
+            "prompt_tokens_max": self._max,
+        }
+
+
+prompt_stats = PromptStats()
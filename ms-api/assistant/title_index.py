@@ -0,0 +1,183 @@
+import asyncio
+import os
+import re
+import sys
+import time
+
+# Окончания для грубого стемминга (от длинных к коротким)
+RUSSIAN_ENDINGS = sorted([
+    "иями", "ями", "ами", "ией", "иях", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ая", "яя", "ое", "ее", "ие", "ые", "ой", "ей", "ий", "ый", "ым", "им", "ом", "ем",
+    "ам", "ям", "ах", "ях", "ию", "ью", "ия", "ья", "ов", "ев",
+    "а", "я", "о", "е", "и", "ы", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+MIN_STEM_LENGTH = 3
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str):
+    return [token for token in re.split(r'[^\w]|_', (text or "").lower()) if len(token) > 2]
+
+
+def _deep_sizeof(obj, seen=None):
+    """Приблизительный объем памяти структуры (dict/set/list/str рекурсивно)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class TitleIndex:
+    """Инвертированный индекс заголовков и кодов МКБ статей в памяти процесса"""
+
+    def __init__(self):
+        self.articles = {}   # id -> {"title", "updated_at", "title_stems", "mkb_tokens"}
+        self.postings = {}   # стем заголовка -> set(id)
+        self.mkb_codes = {}  # токен кода МКБ -> set(id)
+        self.watermark = None
+        self.ready = False
+        self.build_ms = None
+        self.last_refresh_ms = None
+        self.last_refresh_changed = 0
+
+    def _remove(self, article_id):
+        article = self.articles.pop(article_id, None)
+        if not article:
+            return
+        for index, tokens in ((self.postings, article["title_stems"]), (self.mkb_codes, article["mkb_tokens"])):
+            for token in tokens:
+                ids = index.get(token)
+                if ids:
+                    ids.discard(article_id)
+                    if not ids:
+                        del index[token]
+
+    def _add(self, row):
+        self._remove(row["id"])
+        title_stems = {stem(token) for token in tokenize(row["title"])}
+        mkb_tokens = set(tokenize(row["mkb"]))
+        self.articles[row["id"]] = {
+            "title": row["title"],
+            "updated_at": row["changed_at"],
+            "title_stems": title_stems,
+            "mkb_tokens": mkb_tokens,
+        }
+        for token in title_stems:
+            self.postings.setdefault(token, set()).add(row["id"])
+        for token in mkb_tokens:
+            self.mkb_codes.setdefault(token, set()).add(row["id"])
+        changed_at = row["changed_at"]
+        if changed_at is not None and (self.watermark is None or changed_at > self.watermark):
+            self.watermark = changed_at
+
+    async def build(self, db_conn):
+        """Полная перестройка индекса"""
+        started = time.perf_counter()
+        rows = await db_conn.fetch("""
+                                   SELECT id, title, mkb, COALESCE(updated_at, created_at) AS changed_at
+                                   FROM articles
+                                   """)
+        self.articles, self.postings, self.mkb_codes, self.watermark = {}, {}, {}, None
+        for row in rows:
+            self._add(row)
+        self.ready = True
+        self.build_ms = round((time.perf_counter() - started) * 1000, 3)
+        print(f"✅ Индекс заголовков построен: {len(self.articles)} статей за {self.build_ms} мс")
+
+    async def refresh(self, db_conn):
+        """Инкрементальное обновление по updated_at; при удалении статей - полная перестройка"""
+        if not self.ready:
+            await self.build(db_conn)
+            return
+
+        started = time.perf_counter()
+        total = await db_conn.fetchval("SELECT count(*) FROM articles")
+        # updated_at - время начала транзакции записи: транзакция, начатая раньше, но
+        # зафиксированная после прошлого обновления, лежит ниже watermark. Поэтому
+        # перечитываем окно TITLE_INDEX_REFRESH_OVERLAP секунд до него
+        rows = await db_conn.fetch("""
+                                   SELECT id, title, mkb, COALESCE(updated_at, created_at) AS changed_at
+                                   FROM articles
+                                   WHERE $1::timestamp IS NULL
+                                      OR COALESCE(updated_at, created_at) >= $1::timestamp - $2::float8 * interval '1 second'
+                                   """, self.watermark, TITLE_INDEX_REFRESH_OVERLAP)
+        changed = 0
+        for row in rows:
+            indexed = self.articles.get(row["id"])
+            if indexed and indexed["updated_at"] == row["changed_at"]:
+                continue
+            self._add(row)
+            changed += 1
+
+        if total != len(self.articles):
+            await self.build(db_conn)
+            return
+
+        self.last_refresh_changed = changed
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def search(self, terms, limit=5, title_weight=1.0, mkb_weight=0.5):
+        """Ранжирует статьи по числу терминов, совпавших со стемами заголовка и кодами МКБ"""
+        scores = {}
+        for term in terms:
+            for article_id in self.postings.get(stem(term), ()):
+                scores[article_id] = scores.get(article_id, 0.0) + title_weight
+            for article_id in self.mkb_codes.get(term.lower(), ()):
+                scores[article_id] = scores.get(article_id, 0.0) + mkb_weight
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [
+            {
+                "id": article_id,
+                "title": self.articles[article_id]["title"],
+                "updated_at": self.articles[article_id]["updated_at"],
+                "score": score,
+            }
+            for article_id, score in ranked
+        ]
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "articles": len(self.articles),
+            "title_terms": len(self.postings),
+            "mkb_terms": len(self.mkb_codes),
+            "memory_bytes": _deep_sizeof((self.articles, self.postings, self.mkb_codes)),
+            "build_ms": self.build_ms,
+            "last_refresh_ms": self.last_refresh_ms,
+            "last_refresh_changed": self.last_refresh_changed,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+
+async def run_refresh_loop(index, db_pool, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with db_pool.acquire() as conn:
+                await index.refresh(conn)
+        except Exception as e:
+            print(f"Ошибка обновления индекса заголовков: {e}")
+
+
+# Индекс включается переменной окружения ASSISTANT_TITLE_INDEX=1
+TITLE_INDEX_ENABLED = os.getenv("ASSISTANT_TITLE_INDEX", "0") == "1"
+TITLE_INDEX_REFRESH_INTERVAL = float(os.getenv("ASSISTANT_TITLE_INDEX_REFRESH", "60"))
+# Сколько секунд до watermark перечитывать при обновлении (дольше самой длинной транзакции записи)
+TITLE_INDEX_REFRESH_OVERLAP = float(os.getenv("ASSISTANT_TITLE_INDEX_OVERLAP", "300"))
+
+title_index = TitleIndex()
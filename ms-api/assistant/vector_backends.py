@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+class ChromaBackend:
+    """Хранилище векторов в ChromaDB (HNSW)"""
+
+    def __init__(self, path: str, collection_name: str):
+        self.path = path
+        self.collection_name = collection_name
+        self.client = None
+        self.collection = None
+
+    def open(self):
+        import chromadb
+
+        # Новый API ChromaDB
+        self.client = chromadb.PersistentClient(path=self.path)
+
+        # Получаем или создаем коллекцию
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def reset(self):
+        try:
+            self.client.delete_collection(self.collection_name)
+        except ValueError:
+            pass
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def flush(self):
+        pass
+
+    def query(self, embedding, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        results = self.collection.query(query_embeddings=[embedding], n_results=top_k)
+
+        matches = []
+        if results['metadatas'] and results['metadatas'][0]:
+            for i, metadata in enumerate(results['metadatas'][0]):
+                distance = results['distances'][0][i] if results['distances'] else 0
+                matches.append((metadata, 1.0 - distance))
+        return matches
+
+
+class NumpyBackend:
+    """Матрица нормализованных float32-векторов в .npy, открываемая через mmap.
+
+    Каждая запись создает новую версию файлов <name>.<version>.npy / .json и
+    атомарно переключает указатель <name>.current. Воркеры uvicorn открывают один
+    и тот же файл через mmap, поэтому страницы делятся через page cache ОС.
+    Файлы предыдущей версии остаются на диске до следующей публикации: их еще
+    может открывать воркер, прочитавший старый указатель.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        # (версия, np.memmap (N, D) только для чтения, метаданные строк матрицы);
+        # меняется одним присваиванием, чтобы поток в query не смешал матрицу и метаданные разных версий
+        self._snapshot = (None, None, [])
+        self._lock = threading.Lock()
+        self._pending = None   # (ids, matrix, metadatas) - несохраненные изменения
+
+    @property
+    def _pointer_path(self):
+        return os.path.join(self.path, f"{self.name}.current")
+
+    def _files(self, version):
+        base = os.path.join(self.path, f"{self.name}.{version}")
+        return base + ".npy", base + ".json"
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def _current_version(self):
+        try:
+            with open(self._pointer_path, encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """Снимок индекса; перечитывает его, если другой процесс опубликовал новую версию"""
+        version = self._current_version()
+        with self._lock:
+            snapshot = self._snapshot
+            if version == snapshot[0]:
+                return snapshot
+            if version is None:
+                snapshot = (None, None, [])
+            else:
+                matrix_path, meta_path = self._files(version)
+                try:
+                    matrix = np.load(matrix_path, mmap_mode="r")
+                    with open(meta_path, encoding="utf-8") as f:
+                        metadatas = json.load(f)
+                except FileNotFoundError:
+                    # Версию уже сменили дважды - работаем со старым снимком до следующего запроса
+                    return snapshot
+                snapshot = (version, matrix, metadatas)
+            self._snapshot = snapshot
+            return snapshot
+
+    def _editable(self):
+        if self._pending is None:
+            _, loaded, metadatas = self._load()
+            # Пустой индекс сохраняется матрицей (0, 0) - ее размерность не совпадет с новыми векторами
+            matrix = np.array(loaded) if loaded is not None and loaded.size else None
+            ids = [str(metadata['id']) for metadata in metadatas]
+            self._pending = (ids, matrix, list(metadatas))
+        return self._pending
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def reset(self):
+        self._pending = ([], None, [])
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        current_ids, matrix, current_metadatas = self._editable()
+        vectors = self._normalize(embeddings)
+        positions = {article_id: row for row, article_id in enumerate(current_ids)}
+
+        new_rows = []
+        for article_id, vector, metadata in zip(ids, vectors, metadatas):
+            row = positions.get(article_id)
+            if row is None:
+                new_rows.append((article_id, vector, metadata))
+            else:
+                matrix[row] = vector
+                current_metadatas[row] = metadata
+
+        if new_rows:
+            appended = np.stack([vector for _, vector, _ in new_rows])
+            matrix = appended if matrix is None else np.vstack([matrix, appended])
+            current_ids += [article_id for article_id, _, _ in new_rows]
+            current_metadatas += [metadata for _, _, metadata in new_rows]
+
+        self._pending = (current_ids, matrix, current_metadatas)
+
+    def delete(self, ids: List[str]):
+        current_ids, matrix, current_metadatas = self._editable()
+        removed = set(ids)
+        keep = [row for row, article_id in enumerate(current_ids) if article_id not in removed]
+        if len(keep) == len(current_ids):
+            return
+        self._pending = (
+            [current_ids[row] for row in keep],
+            matrix[keep] if matrix is not None and keep else None,
+            [current_metadatas[row] for row in keep],
+        )
+
+    def flush(self):
+        """Публикует новую версию индекса"""
+        if self._pending is None:
+            return
+        _, matrix, metadatas = self._pending
+        old_version = self._current_version()
+
+        version = uuid.uuid4().hex
+        matrix_path, meta_path = self._files(version)
+        if matrix is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        np.save(matrix_path, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(metadatas, f, ensure_ascii=False)
+
+        tmp_pointer = f"{self._pointer_path}.{version}.tmp"
+        with open(tmp_pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_pointer, self._pointer_path)
+
+        self._pending = None
+        self._load()
+        self._remove_stale_versions(keep={version, old_version})
+
+    def _remove_stale_versions(self, keep):
+        """Удаляет файлы всех версий, кроме текущей и предыдущей.
+
+        Открытые mmap продолжают работать и после удаления файлов.
+        """
+        prefix = f"{self.name}."
+        for file_name in os.listdir(self.path):
+            if not file_name.startswith(prefix) or not file_name.endswith((".npy", ".json")):
+                continue
+            version = file_name[len(prefix):].rsplit(".", 1)[0]
+            if version in keep or "." in version:
+                continue
+            try:
+                os.remove(os.path.join(self.path, file_name))
+            except FileNotFoundError:
+                pass
+
+    def query(self, embedding, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        _, matrix, metadatas = self._load()
+        if matrix is None or not len(metadatas):
+            return []
+
+        scores = matrix @ self._normalize(embedding)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(metadatas[row], float(scores[row])) for row in top]
@@ -1,146 +1,235 @@
-# import chromadb
-# import openai
-# import os
-# from typing import List, Dict, Any
-# from dotenv import load_dotenv
-#
-# # Загружаем переменные окружения
-# load_dotenv()
-#
-# class VectorSearchEngine:
-#     def __init__(self):
-#         self.client = None
-#         self.collection = None
-#         self.openai_client = None
-#         self._initialized = False
-#
-#     def initialize(self):
-#         """Ленивая инициализация"""
-#         if self._initialized:
-#             return
-#
-#         # Отключаем телеметрию для избежания ошибок
-#         os.environ["ANONYMIZED_TELEMETRY"] = "False"
-#
-#         # Проверяем наличие API ключа
-#         api_key = os.getenv("OPENAI_API_KEY")
-#         if not api_key:
-#             print("❌ OPENAI_API_KEY не найден в переменных окружения")
-#             return
-#
-#         # Новый API ChromaDB
-#         self.client = chromadb.PersistentClient(path="./chroma_db")
-#
-#         # Получаем или создаем коллекцию
-#         self.collection = self.client.get_or_create_collection(
-#             name="medical_articles",
-#             metadata={"hnsw:space": "cosine"}
-#         )
-#
-#         self.openai_client = openai.OpenAI(api_key=api_key)
-#         self._initialized = True
-#         print("✅ Векторный поиск инициализирован")
-#
-#     def embed_text(self, text: str) -> List[float]:
-#         """Создаем эмбеддинг через OpenAI"""
-#         self.initialize()
-#         response = self.openai_client.embeddings.create(
-#             model="text-embedding-3-small",
-#             input=text
-#         )
-#         return response.data[0].embedding
-#
-#     def index_articles(self, db_conn):
-#         """Индексируем все статьи"""
-#         self.initialize()
-#         cursor = db_conn.cursor()
-#
-#         cursor.execute("""
-#             SELECT a.id, a.title, a.mkb, a.medical_section,
-#                    string_agg(s.section_title || ': ' || substring(
-#                        regexp_replace(s.html_content, '<[^>]+>', '', 'g'), 1, 200
-#                    ), ' | ') as content_summary
-#             FROM articles a
-#             LEFT JOIN article_sections s ON a.id = s.article_id
-#             WHERE a.is_archived = false
-#             GROUP BY a.id, a.title, a.mkb, a.medical_section
-#             LIMIT 100
-#         """)
-#
-#         articles = cursor.fetchall()
-#         cursor.close()
-#
-#         if not articles:
-#             print("❌ Нет статей для индексации")
-#             return
-#
-#         # Подготавливаем данные для индексации
-#         documents = []
-#         metadatas = []
-#         ids = []
-#
-#         for article in articles:
-#             # Формируем текст для индексации
-#             text = f"Заболевание: {article['title']}"
-#             if article['mkb']:
-#                 text += f" МКБ: {article['mkb']}"
-#             if article['medical_section']:
-#                 text += f" Раздел: {article['medical_section']}"
-#             if article['content_summary']:
-#                 text += f" Содержание: {article['content_summary']}"
-#
-#             documents.append(text)
-#             metadatas.append({
-#                 'id': article['id'],
-#                 'title': article['title'],
-#                 'mkb': article['mkb'],
-#                 'medical_section': article['medical_section']
-#             })
-#             ids.append(str(article['id']))
-#
-#         # Очищаем старые данные
-#         try:
-#             self.collection.delete(where={})
-#         except:
-#             pass
-#
-#         # Добавляем в векторную базу
-#         self.collection.add(
-#             documents=documents,
-#             metadatas=metadatas,
-#             ids=ids
-#         )
-#
-#         print(f"✅ Проиндексировано {len(documents)} статей")
-#
-#     def search_articles(self, question: str, top_k: int = 3) -> List[Dict[str, Any]]:
-#         """Поиск релевантных статей"""
-#         self.initialize()
-#         try:
-#             results = self.collection.query(
-#                 query_texts=[question],
-#                 n_results=top_k
-#             )
-#
-#             articles = []
-#             if results['metadatas'] and results['metadatas'][0]:
-#                 for i, metadata in enumerate(results['metadatas'][0]):
-#                     distance = results['distances'][0][i] if results['distances'] else 0
-#                     relevance_score = 1.0 - distance
-#
-#                     articles.append({
-#                         'id': metadata['id'],
-#                         'title': metadata['title'],
-#                         'mkb': metadata['mkb'],
-#                         'medical_section': metadata['medical_section'],
-#                         'relevance_score': relevance_score
-#                     })
-#
-#             return articles
-#
-#         except Exception as e:
-#             print(f"Ошибка поиска: {e}")
-#             return []
-#
-# # Глобальный экземпляр (но НЕ инициализируем сразу)
-# vector_search = VectorSearchEngine()
\ No newline at end of file
+import json
+import openai
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+from dotenv import load_dotenv
+from .embedding_cache import embedding_cache
+from .vector_backends import ChromaBackend, NumpyBackend
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# chroma - HNSW в ChromaDB, numpy - матрица в .npy через mmap (без chromadb в воркерах API)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+NUMPY_INDEX_PATH = os.getenv("VECTOR_NUMPY_PATH", "./vector_index")
+COLLECTION_NAME = os.getenv("VECTOR_COLLECTION", "medical_articles")
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Сколько статей читаем из БД и отправляем на эмбеддинг за один запрос
+INDEX_BATCH_SIZE = int(os.getenv("VECTOR_INDEX_BATCH_SIZE", "256"))
+# Публикуем индекс раз в столько пачек: у numpy каждая публикация переписывает всю матрицу
+INDEX_FLUSH_EVERY = int(os.getenv("VECTOR_INDEX_FLUSH_EVERY", "20"))
+# Сколько секунд до сохраненной позиции перечитывать в следующем запуске (дольше самой длинной транзакции записи)
+INDEX_OVERLAP = float(os.getenv("VECTOR_INDEX_OVERLAP", "300"))
+# Максимум текстов в одном запросе к API эмбеддингов
+EMBEDDING_REQUEST_SIZE = 512
+
+
+class VectorSearchEngine:
+    def __init__(self, backend: str = VECTOR_BACKEND):
+        self.backend_name = backend
+        self.backend = None
+        self.openai_client = None
+        self._initialized = False
+
+    def initialize(self):
+        """Ленивая инициализация"""
+        if self._initialized:
+            return
+
+        # Отключаем телеметрию для избежания ошибок
+        os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+        # Проверяем наличие API ключа
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("❌ OPENAI_API_KEY не найден в переменных окружения")
+            return
+
+        if self.backend_name == "numpy":
+            self.backend = NumpyBackend(NUMPY_INDEX_PATH, COLLECTION_NAME)
+        else:
+            self.backend = ChromaBackend(CHROMA_PATH, COLLECTION_NAME)
+        self.backend.open()
+
+        self.openai_client = openai.OpenAI(api_key=api_key)
+        self._initialized = True
+        print(f"✅ Векторный поиск инициализирован ({self.backend_name})")
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги пачки текстов: из кэша, а недостающие - пачками из OpenAI"""
+        self.initialize()
+        if not texts:
+            return []
+
+        vectors = embedding_cache.get_many(texts, EMBEDDING_MODEL)
+        missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+
+        for start in range(0, len(missing), EMBEDDING_REQUEST_SIZE):
+            chunk = missing[start:start + EMBEDDING_REQUEST_SIZE]
+            response = self.openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=chunk
+            )
+            fresh = {
+                chunk[item.index]: item.embedding
+                for item in response.data
+            }
+            embedding_cache.put_many(fresh, EMBEDDING_MODEL)
+            vectors.update(fresh)
+
+        return [vectors[text] for text in texts]
+
+    def embed_text(self, text: str) -> List[float]:
+        """Создаем эмбеддинг через OpenAI"""
+        return self.embed_texts([text])[0]
+
+    @property
+    def _state_path(self):
+        base = NUMPY_INDEX_PATH if self.backend_name == "numpy" else CHROMA_PATH
+        return os.path.join(base, f"{COLLECTION_NAME}_index_state.json")
+
+    def _load_watermark(self):
+        """(changed_at, id) последней проиндексированной статьи или None"""
+        try:
+            with open(self._state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not state.get("watermark"):
+            return None
+        # В старом файле состояния нет id: статьи с той же меткой времени переиндексируем
+        return datetime.fromisoformat(state["watermark"]), state.get("id", 0)
+
+    def _save_watermark(self, watermark):
+        changed_at, article_id = watermark
+        with open(self._state_path, "w", encoding="utf-8") as f:
+            json.dump({"watermark": changed_at.isoformat(), "id": article_id}, f)
+
+    @staticmethod
+    def _article_document(article) -> str:
+        # Формируем текст для индексации
+        text = f"Заболевание: {article['title']}"
+        if article['mkb']:
+            text += f" МКБ: {article['mkb']}"
+        if article['medical_section']:
+            text += f" Раздел: {article['medical_section']}"
+        if article['content_summary']:
+            text += f" Содержание: {article['content_summary']}"
+        return text
+
+    def index_articles(self, db_conn, full: bool = False):
+        """Индексируем статьи, измененные после последней индексации (full=True - все заново)"""
+        self.initialize()
+
+        if full:
+            self.backend.reset()
+            last_key = None
+        else:
+            last_key = self._load_watermark()
+            # updated_at - время начала транзакции записи: статья из транзакции, начатой раньше,
+            # но зафиксированной после прошлого запуска, лежит ниже позиции. Повторный эмбеддинг
+            # окна почти бесплатен - векторы берутся из кэша по хэшу текста
+            if last_key and INDEX_OVERLAP:
+                last_key = (last_key[0] - timedelta(seconds=INDEX_OVERLAP), 0)
+
+        since = f"{last_key[0].isoformat()} (id > {last_key[1]})" if last_key else "начала времен"
+        print(f"🔄 Индексация статей, измененных после: {since}")
+
+        started = time.perf_counter()
+        upserted = 0
+        deleted = 0
+        batches = 0
+        cursor = db_conn.cursor()
+
+        while True:
+            # Keyset по (changed_at, id): у многих статей одна метка времени, и граница
+            # пачки или сохраненной позиции может пройти внутри такой группы
+            where_sql = ""
+            params = []
+            if last_key:
+                where_sql = "WHERE (COALESCE(a.updated_at, a.created_at), a.id) > (%s, %s)"
+                params = list(last_key)
+
+            cursor.execute(f"""
+                SELECT a.id, a.title, a.mkb, a.medical_section, a.is_archived,
+                       COALESCE(a.updated_at, a.created_at) AS changed_at,
+                       (SELECT string_agg(s.section_title || ': ' || left(coalesce(s.plain_text, ''), 200), ' | ' ORDER BY s.id)
+                        FROM article_sections s
+                        WHERE s.article_id = a.id) AS content_summary
+                FROM articles a
+                {where_sql}
+                ORDER BY changed_at, a.id
+                LIMIT %s
+            """, params + [INDEX_BATCH_SIZE])
+            articles = cursor.fetchall()
+
+            if not articles:
+                break
+
+            # Архивные статьи убираем из индекса, остальные добавляем или заменяем
+            archived_ids = [str(article['id']) for article in articles if article['is_archived']]
+            active = [article for article in articles if not article['is_archived']]
+
+            if archived_ids:
+                self.backend.delete(archived_ids)
+                deleted += len(archived_ids)
+
+            if active:
+                documents = [self._article_document(article) for article in active]
+                self.backend.upsert(
+                    ids=[str(article['id']) for article in active],
+                    embeddings=self.embed_texts(documents),
+                    documents=documents,
+                    metadatas=[{
+                        'id': article['id'],
+                        'title': article['title'],
+                        'mkb': article['mkb'] or "",
+                        'medical_section': article['medical_section'] or ""
+                    } for article in active]
+                )
+                upserted += len(active)
+
+            last_key = (articles[-1]['changed_at'], articles[-1]['id'])
+            batches += 1
+            if batches % INDEX_FLUSH_EVERY == 0:
+                # Прогресс сохраняем только вместе с опубликованным индексом: после сбоя продолжим отсюда
+                self.backend.flush()
+                self._save_watermark(last_key)
+            print(f"   ... обработано {upserted + deleted} статей")
+
+        cursor.close()
+        self.backend.flush()
+        if last_key:
+            self._save_watermark(last_key)
+
+        elapsed = time.perf_counter() - started
+        rate = (upserted + deleted) / elapsed if elapsed > 0 else 0
+        print(f"✅ Проиндексировано {upserted} статей, удалено {deleted} за {elapsed:.1f} сек ({rate:.1f} док/с)")
+        return {"upserted": upserted, "deleted": deleted, "seconds": round(elapsed, 3), "docs_per_second": round(rate, 1)}
+
+    def search_articles(self, question: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """Поиск релевантных статей"""
+        self.initialize()
+        try:
+            matches = self.backend.query(self.embed_text(question), top_k)
+
+            return [
+                {
+                    'id': metadata['id'],
+                    'title': metadata['title'],
+                    'mkb': metadata['mkb'],
+                    'medical_section': metadata['medical_section'],
+                    'relevance_score': relevance_score
+                }
+                for metadata, relevance_score in matches
+            ]
+
+        except Exception as e:
+            print(f"Ошибка поиска: {e}")
+            return []
+
+# Глобальный экземпляр (но НЕ инициализируем сразу)
+vector_search = VectorSearchEngine()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import sys
+import time
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from db import DATABASE_URL, replace_section_chunks
+from text_utils import section_text_fields
+
+BATCH_SIZE = 500
+MISSING_ONLY = """
+                  AND (s.plain_text IS NULL
+                       OR NOT EXISTS (SELECT 1 FROM article_section_chunks c WHERE c.section_id = s.id))"""
+
+
+def main():
+    # --all пересчитывает все секции, по умолчанию только незаполненные или без фрагментов
+    recompute_all = "--all" in sys.argv
+
+    conn = psycopg2.connect(dsn=DATABASE_URL, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+
+    try:
+        started = time.perf_counter()
+        last_id = 0
+        processed = 0
+
+        while True:
+            cur.execute(f"""
+                SELECT s.id, s.article_id, s.html_content
+                FROM article_sections s
+                WHERE s.id > %s {"" if recompute_all else MISSING_ONLY}
+                ORDER BY s.id
+                LIMIT %s
+            """, (last_id, BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            values = [(row["id"], *section_text_fields(row["html_content"])) for row in rows]
+            execute_values(cur, """
+                UPDATE article_sections AS s
+                SET plain_text = v.plain_text,
+                    token_count = v.token_count
+                FROM (VALUES %s) AS v (id, plain_text, token_count)
+                WHERE s.id = v.id
+            """, values)
+            for row, (_, plain_text, _) in zip(rows, values):
+                replace_section_chunks(cur, row["id"], row["article_id"], plain_text)
+            conn.commit()
+
+            last_id = rows[-1]["id"]
+            processed += len(rows)
+            print(f"🔄 Обработано секций: {processed}")
+
+        elapsed = time.perf_counter() - started
+        print(f"\n✅ Заполнено {processed} секций за {elapsed:.1f} сек")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка: {str(e)}")
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Скорость разбора страницы статьи разными парсерами BeautifulSoup.
+
+python benchmark_parsers.py [файл.html] [число повторов]
+"""
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from parse_sections import PARSE_WORKERS, parse_article_sections
+
+PARSERS = ["html.parser", "lxml", "html5lib"]
+
+
+def available(parser: str) -> bool:
+    try:
+        parse_article_sections(0, "<article></article>", parser)
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "gingivit.html"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+
+    reference = parse_article_sections(0, html, "html.parser")
+    print(f"📄 {path}: {len(html) // 1024} КБ, разделов: {len(reference)}, повторов: {repeats}\n")
+
+    for parser in PARSERS:
+        if not available(parser):
+            print(f"⚠️ {parser}: не установлен")
+            continue
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            sections = parse_article_sections(0, html, parser)
+        elapsed = time.perf_counter() - started
+
+        same = "✅ разделы совпадают" if sections == reference else "❌ разделы отличаются"
+        print(f"{parser:12} {repeats / elapsed:8.1f} стр/с   {same}")
+
+        # Тот же разбор в пуле процессов, как в parse_sections.py
+        with ProcessPoolExecutor(PARSE_WORKERS) as pool:
+            list(pool.map(parse_article_sections, [0] * PARSE_WORKERS, [html] * PARSE_WORKERS, [parser] * PARSE_WORKERS))
+            started = time.perf_counter()
+            list(pool.map(parse_article_sections, [0] * repeats, [html] * repeats, [parser] * repeats))
+            elapsed = time.perf_counter() - started
+        print(f"{'':12} {repeats / elapsed:8.1f} стр/с   пул из {PARSE_WORKERS} процессов")
+
+
+if __name__ == "__main__":
+    main()
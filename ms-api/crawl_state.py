@@ -0,0 +1,68 @@
+import sys
+
+# Запуски парсеров в таблице crawl_runs. Незавершенный запуск с тем же видом и
+# разбиением на воркеры продолжается с сохраненной позиции.
+
+
+def arg_value(name: str, default=None):
+    """Значение аргумента командной строки вида --name value"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+def shard_args():
+    """(число воркеров, номер воркера) из --workers M --worker-index i"""
+    workers = int(arg_value("--workers", 1))
+    worker_index = int(arg_value("--worker-index", 0))
+    if workers < 1 or not 0 <= worker_index < workers:
+        raise ValueError("Нужно --workers M и --worker-index от 0 до M-1")
+    return workers, worker_index
+
+
+def start_run(cur, kind: str, workers: int = 1, worker_index: int = 0, restart: bool = False):
+    """Незавершенный запуск этого вида и воркера или новый; restart=True закрывает старый"""
+    if restart:
+        cur.execute("""
+            UPDATE crawl_runs SET finished_at = NOW(), updated_at = NOW()
+            WHERE kind = %s AND workers = %s AND worker_index = %s AND finished_at IS NULL
+        """, (kind, workers, worker_index))
+    else:
+        cur.execute("""
+            SELECT id, position
+            FROM crawl_runs
+            WHERE kind = %s AND workers = %s AND worker_index = %s AND finished_at IS NULL
+            ORDER BY id DESC
+            LIMIT 1
+        """, (kind, workers, worker_index))
+        run = cur.fetchone()
+        if run:
+            print(f"🔄 Продолжаем запуск {run['id']} ({kind}, воркер {worker_index + 1} из {workers})")
+            return run
+
+    cur.execute("""
+        INSERT INTO crawl_runs (kind, workers, worker_index)
+        VALUES (%s, %s, %s)
+        RETURNING id, position
+    """, (kind, workers, worker_index))
+    run = cur.fetchone()
+    print(f"🔄 Новый запуск {run['id']} ({kind}, воркер {worker_index + 1} из {workers})")
+    return run
+
+
+def save_position(cur, run_id: int, position: int):
+    cur.execute("UPDATE crawl_runs SET position = %s, updated_at = NOW() WHERE id = %s", (position, run_id))
+
+
+def record_failure(cur, run_id: int, error: str):
+    cur.execute("""
+        UPDATE crawl_runs
+        SET failures = failures + 1, last_error = %s, updated_at = NOW()
+        WHERE id = %s
+    """, (error, run_id))
+
+
+def finish_run(cur, run_id: int):
+    cur.execute("UPDATE crawl_runs SET finished_at = NOW(), updated_at = NOW() WHERE id = %s", (run_id,))
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Адрес сайта-источника; для проверки парсеров можно указать локальный сервер с сохраненными страницами
+CRAWLER_BASE_URL = os.getenv("CRAWLER_BASE_URL", "https://diseases.medelement.com").rstrip("/")
+CRAWLER_CONCURRENCY = int(os.getenv("CRAWLER_CONCURRENCY", "8"))
+# Не больше стольких запросов в секунду к одному хосту
+CRAWLER_RATE_LIMIT = float(os.getenv("CRAWLER_RATE_LIMIT", "4"))
+CRAWLER_TIMEOUT = float(os.getenv("CRAWLER_TIMEOUT", "20"))
+CRAWLER_MAX_RETRIES = int(os.getenv("CRAWLER_MAX_RETRIES", "3"))
+CRAWLER_BACKOFF_BASE = float(os.getenv("CRAWLER_BACKOFF_BASE", "0.5"))
+CRAWLER_BACKOFF_MAX = 30.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": f"{CRAWLER_BASE_URL}/",
+}
+
+
+class HostRateLimiter:
+    """Равномерно разносит запросы к каждому хосту: не чаще rate в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at = {}  # хост -> время, раньше которого следующий запрос не отправляем
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at.get(host, now))
+            self._next_at[host] = start_at + self.interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+
+class Crawler:
+    """Общий HTTP-клиент парсеров: keep-alive, лимит параллельности и частоты, таймауты и повторы"""
+
+    def __init__(self, base_url=CRAWLER_BASE_URL, concurrency=CRAWLER_CONCURRENCY, rate_limit=CRAWLER_RATE_LIMIT,
+                 timeout=CRAWLER_TIMEOUT, max_retries=CRAWLER_MAX_RETRIES, backoff_base=CRAWLER_BACKOFF_BASE,
+                 transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            # В тестах - httpx.MockTransport с сохраненными страницами
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._rate_limiter = HostRateLimiter(rate_limit)
+
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+        self._bytes = 0
+        self._started = time.monotonic()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    def url(self, path: str) -> str:
+        """Абсолютный адрес для пути сайта (ссылки в выдаче относительные)"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff_delay(self, attempt, response=None):
+        delay = random.uniform(0, min(CRAWLER_BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def fetch(self, path: str, params=None, headers=None) -> httpx.Response:
+        """GET с повторами при сетевых ошибках, 429 и 5xx; остальные ошибки 4xx пробрасываются"""
+        url = self.url(path)
+        host = urlsplit(url).netloc
+        attempt = 0
+
+        while True:
+            response = None
+            try:
+                async with self._semaphore:
+                    await self._rate_limiter.wait(host)
+                    self._requests += 1
+                    response = await self.client.get(url, params=params, headers=headers)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    # 304 на условный запрос - не ошибка
+                    if response.status_code >= 400:
+                        response.raise_for_status()
+                    self._bytes += len(response.content)
+                    return response
+                error = f"HTTP {response.status_code}"
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error = type(e).__name__
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self._failures += 1
+                if response is not None:
+                    response.raise_for_status()
+                raise httpx.TransportError(f"{url}: {error} после {self.max_retries} повторов")
+
+            delay = self._backoff_delay(attempt, response)
+            self._retries += 1
+            print(f"⚠️ {url}: {error}, повтор {attempt}/{self.max_retries} через {delay:.2f} сек")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            "requests": self._requests,
+            "retries": self._retries,
+            "failures": self._failures,
+            "bytes": self._bytes,
+            "seconds": round(elapsed, 1),
+            "requests_per_second": round(self._requests / elapsed, 2) if elapsed > 0 else 0.0,
+        }
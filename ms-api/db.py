@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import asyncpg
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from dotenv import load_dotenv
+from text_utils import split_into_chunks
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Настройки пула соединений (переопределяются через .env)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Соединение, пролежавшее в пуле дольше этого времени (сек), проверяется SELECT 1
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+
+# Асинхронный пул (asyncpg) для ассистента: соединение держится только на время запросов к БД
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv("ASYNC_DB_POOL_MIN_SIZE", "2"))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv("ASYNC_DB_POOL_MAX_SIZE", "20"))
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений psycopg2 с ожиданием и статистикой"""
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=5.0, check_idle=30.0):
+        if min_size > max_size:
+            raise ValueError("min_size не может быть больше max_size")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+
+        self._idle = deque()  # (conn, время возврата в пул)
+        self._size = 0
+        self._waiting = 0
+        self._closed = True
+        self._cond = threading.Condition()
+
+        self._acquired = 0
+        self._timeouts = 0
+        self._replaced = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        return psycopg2.connect(dsn=self.dsn, cursor_factory=RealDictCursor)
+
+    def open(self):
+        with self._cond:
+            self._closed = False
+        for _ in range(self.min_size):
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                conn.close()
+                self._size -= 1
+            self._cond.notify_all()
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Пул соединений закрыт")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободных соединений за {timeout} сек (max_size={self.max_size})"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, time.monotonic() - returned_at):
+                # Битое соединение выбрасываем и пробуем снова
+                self._discard(conn)
+                with self._cond:
+                    self._replaced += 1
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._acquired += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.putconn(conn, discard=conn.closed)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.max_size, 3),
+                "acquired_total": self._acquired,
+                "timeouts_total": self._timeouts,
+                "replaced_total": self._replaced,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+db_pool = ConnectionPool(
+    DATABASE_URL,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    check_idle=DB_POOL_CHECK_IDLE,
+)
+
+
+@contextmanager
+def get_connection():
+    with db_pool.connection() as conn:
+        yield conn
+
+
+@contextmanager
+def get_cursor():
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cursor.close()
+
+
+async_db_pool = None
+
+
+async def open_async_pool():
+    global async_db_pool
+    async_db_pool = await asyncpg.create_pool(
+        dsn=DATABASE_URL,
+        min_size=ASYNC_DB_POOL_MIN_SIZE,
+        max_size=ASYNC_DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+    )
+    return async_db_pool
+
+
+async def close_async_pool():
+    global async_db_pool
+    if async_db_pool is not None:
+        await async_db_pool.close()
+        async_db_pool = None
+
+
+@asynccontextmanager
+async def get_async_connection():
+    async with async_db_pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+        yield conn
+
+
+def async_pool_stats():
+    if async_db_pool is None:
+        return None
+    size = async_db_pool.get_size()
+    idle = async_db_pool.get_idle_size()
+    return {
+        "min_size": async_db_pool.get_min_size(),
+        "max_size": async_db_pool.get_max_size(),
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "saturation": round((size - idle) / async_db_pool.get_max_size(), 3),
+    }
+
+
+def sync_article_medical_sections(cur, article_id, medical_section):
+    """Пересобирает связи статьи с разделами медицины по строке medical_section"""
+    names = [name.strip() for name in (medical_section or "").split(",") if name.strip()]
+
+    cur.execute("DELETE FROM article_medical_sections WHERE article_id = %s", (article_id,))
+    if names:
+        cur.execute("""
+            INSERT INTO article_medical_sections (article_id, section_id)
+            SELECT %s, ms.id
+            FROM medical_sections ms
+            WHERE trim(ms.name) = ANY(%s)
+            ON CONFLICT DO NOTHING
+        """, (article_id, names))
+
+
+def link_articles_to_medical_sections(cur):
+    """Достраивает связи всех статей с разделами медицины (как при миграции 001).
+
+    Нужно после добавления новых разделов: статьи, загруженные раньше раздела,
+    иначе не попадут в GET /articles до следующей правки или парсинга.
+    Возвращает число добавленных связей.
+    """
+    cur.execute("""
+        INSERT INTO article_medical_sections (article_id, section_id)
+        SELECT DISTINCT a.id, ms.id
+        FROM articles a
+        CROSS JOIN unnest(string_to_array(a.medical_section, ',')) AS section_name
+        INNER JOIN medical_sections ms ON trim(ms.name) = trim(section_name)
+        ON CONFLICT DO NOTHING
+    """)
+    return cur.rowcount
+
+
+def replace_section_chunks(cur, section_id, article_id, plain_text):
+    """Пересобирает фрагменты секции, по которым ассистент выбирает контекст"""
+    cur.execute("DELETE FROM article_section_chunks WHERE section_id = %s", (section_id,))
+    chunks = split_into_chunks(plain_text)
+    if chunks:
+        execute_values(cur, """
+            INSERT INTO article_section_chunks (section_id, article_id, chunk_index, content, token_count)
+            VALUES %s
+        """, [
+            (section_id, article_id, index, content, token_count)
+            for index, (content, token_count) in enumerate(chunks)
+        ])
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Браузер и CDN хранят ответ, но перед показом проверяют его условным запросом
+ARTICLE_CACHE_CONTROL = os.getenv("ARTICLE_CACHE_CONTROL", "no-cache")
+
+
+def payload_etag(payload) -> str:
+    """Строгий ETag по содержимому ответа"""
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return f'"{hashlib.md5(body.encode("utf-8")).hexdigest()}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Для GET допускается слабое сравнение: W/"x" совпадает с "x"
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime = None) -> bool:
+    """Проверка If-None-Match, а если его нет - If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # В заголовке время с точностью до секунды
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def cache_headers(etag: str, last_modified: datetime = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": ARTICLE_CACHE_CONTROL}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(etag: str, last_modified: datetime = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
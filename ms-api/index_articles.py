@@ -1,18 +1,22 @@
 #!/usr/bin/env python3
+import sys
 from assistant.vector_search import vector_search
-from main import DATABASE_URL
+from db import DATABASE_URL
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 def main():
+    # --full переиндексирует весь каталог с нуля, по умолчанию - только измененные статьи
+    full = "--full" in sys.argv
+
     print("🔄 Подключение к базе данных...")
     conn = psycopg2.connect(dsn=DATABASE_URL, cursor_factory=RealDictCursor)
 
     print("🔄 Индексация статей...")
-    vector_search.index_articles(conn)
+    vector_search.index_articles(conn, full=full)
     print("✅ Индексация завершена")
 
     conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,275 @@
+import hashlib
+import io
+import time
+from psycopg2.extras import execute_values
+from text_utils import section_content_hash, section_text_fields, split_into_chunks
+
+# Запись результатов парсинга пачками: COPY во временную таблицу и один
+# set-based запрос на пачку вместо запроса на каждую строку
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+
+def copy_rows(cur, table: str, columns, rows):
+    """COPY строк в таблицу в текстовом формате"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _report(what: str, rows: int, started: float):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"💾 {what}: {rows} строк за {elapsed * 1000:.0f} мс ({rate:.0f} строк/с)")
+
+
+def upsert_articles(cur, articles):
+    """Upsert статей выдачи по url и пересборка их связей с разделами медицины.
+
+    Возвращает (добавлено, обновлено).
+    """
+    if not articles:
+        return 0, 0
+    started = time.perf_counter()
+
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS articles_staging (
+            seq INTEGER,
+            title TEXT,
+            url TEXT,
+            medical_section TEXT,
+            version TEXT,
+            mkb TEXT,
+            is_archived BOOLEAN
+        ) ON COMMIT DELETE ROWS
+    """)
+    cur.execute("TRUNCATE articles_staging")
+    copy_rows(cur, "articles_staging", ["seq", "title", "url", "medical_section", "version", "mkb", "is_archived"], [
+        (seq, item["title"], item["url"], item["medical_section"], item["version"], item["mkb"], item["is_archived"])
+        for seq, item in enumerate(articles)
+    ])
+
+    # Одна и та же статья может встретиться в пачке дважды - берем последнюю версию
+    cur.execute("""
+        INSERT INTO articles (title, url, medical_section, version, mkb, is_archived)
+        SELECT DISTINCT ON (url) title, url, medical_section, version, mkb, is_archived
+        FROM articles_staging
+        ORDER BY url, seq DESC
+        ON CONFLICT (url) DO UPDATE SET
+            title = EXCLUDED.title,
+            medical_section = EXCLUDED.medical_section,
+            version = EXCLUDED.version,
+            mkb = EXCLUDED.mkb,
+            is_archived = EXCLUDED.is_archived,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING id, (xmax = 0) AS inserted
+    """)
+    rows = cur.fetchall()
+    article_ids = [row["id"] for row in rows]
+    inserted = sum(1 for row in rows if row["inserted"])
+
+    cur.execute("DELETE FROM article_medical_sections WHERE article_id = ANY(%s)", (article_ids,))
+    cur.execute("""
+        INSERT INTO article_medical_sections (article_id, section_id)
+        SELECT DISTINCT a.id, ms.id
+        FROM articles a
+        CROSS JOIN unnest(string_to_array(a.medical_section, ',')) AS section_name
+        INNER JOIN medical_sections ms ON trim(ms.name) = trim(section_name)
+        WHERE a.id = ANY(%s)
+        ON CONFLICT DO NOTHING
+    """, (article_ids,))
+
+    _report("Статьи", len(rows), started)
+    return inserted, len(rows) - inserted
+
+
+def replace_article_sections(cur, sections_by_article):
+    """Заменяет разделы статей: {article_id: [(section_title, html_content), ...]}.
+
+    id разделов выделяются заранее из последовательности, поэтому разделы и их
+    фрагменты для поиска загружаются двумя COPY без возврата id по строкам.
+    Сдвигает articles.updated_at. Возвращает число записанных разделов.
+    """
+    if not sections_by_article:
+        return 0
+    started = time.perf_counter()
+    article_ids = list(sections_by_article)
+
+    # Фрагменты удаляются каскадом
+    cur.execute("DELETE FROM article_sections WHERE article_id = ANY(%s)", (article_ids,))
+    # Как и sync_article_sections: индексатор и Last-Modified видят статью измененной
+    cur.execute("UPDATE articles SET updated_at = NOW() WHERE id = ANY(%s)", (article_ids,))
+
+    total = sum(len(sections) for sections in sections_by_article.values())
+    if not total:
+        return 0
+    cur.execute("""
+        SELECT nextval(pg_get_serial_sequence('article_sections', 'id')) AS id
+        FROM generate_series(1, %s)
+    """, (total,))
+    section_ids = iter(row["id"] for row in cur.fetchall())
+
+    section_rows = []
+    chunk_rows = []
+    for article_id, sections in sections_by_article.items():
+        for section_title, html_content in sections:
+            section_id = next(section_ids)
+            plain_text, token_count = section_text_fields(html_content)
+            section_rows.append((section_id, article_id, section_title, html_content, plain_text, token_count,
+                                 section_content_hash(section_title, html_content)))
+            chunk_rows.extend(
+                (section_id, article_id, index, content, chunk_tokens)
+                for index, (content, chunk_tokens) in enumerate(split_into_chunks(plain_text))
+            )
+
+    copy_rows(cur, "article_sections",
+              ["id", "article_id", "section_title", "html_content", "plain_text", "token_count", "content_hash"],
+              section_rows)
+    copy_rows(cur, "article_section_chunks",
+              ["section_id", "article_id", "chunk_index", "content", "token_count"], chunk_rows)
+
+    _report("Разделы", len(section_rows), started)
+    return len(section_rows)
+
+
+def article_content_hash(sections) -> str:
+    """Хэш всех разделов статьи [(заголовок, html)] в их порядке"""
+    digest = hashlib.md5()
+    for section_title, html_content in sections:
+        digest.update(section_content_hash(section_title, html_content).encode())
+    return digest.hexdigest()
+
+
+def _match_section_ids(existing_ids, section_ids):
+    """Сопоставление по id, если оно есть и сохраняет порядок разделов, иначе None.
+
+    Новые разделы получают id больше существующих, поэтому без перенумерации
+    они могут идти только после последнего сохраненного раздела.
+    """
+    known = set(existing_ids)
+    targets = []
+    last_id = None
+    for section_id in section_ids:
+        if section_id not in known or section_id in targets:
+            targets.append(None)
+            continue
+        # id идут не по возрастанию или после нового раздела - порядок по id не сохранить
+        if (last_id is not None and section_id < last_id) or None in targets:
+            return None
+        targets.append(section_id)
+        last_id = section_id
+    if last_id is None:
+        return None  # ни один id не совпал - сопоставляем по порядку
+    return targets
+
+
+def sync_article_sections(cur, article_id, sections, section_ids=None):
+    """Приводит разделы статьи к списку [(заголовок, html)], переписывая только изменившиеся.
+
+    Разделы сопоставляются по id из section_ids (None - новый раздел), а если
+    их нет или порядок по id не сохраняется - по порядку: совпавший хэш - раздел
+    не трогаем, отличающийся - обновляем на месте, лишние удаляем, недостающие добавляем.
+    Если что-то изменилось, сдвигается articles.updated_at.
+    Возвращает {"unchanged", "updated", "inserted", "deleted"} и списки
+    updated_ids, inserted_ids (в порядке новых разделов в sections), deleted_ids.
+    """
+    cur.execute("""
+        SELECT id, content_hash
+        FROM article_sections
+        WHERE article_id = %s
+        ORDER BY id
+    """, (article_id,))
+    existing = cur.fetchall()
+    hashes = {row["id"]: row["content_hash"] for row in existing}
+
+    targets = _match_section_ids(list(hashes), section_ids) if section_ids is not None else None
+    if targets is None:
+        targets = [row["id"] for row in existing[:len(sections)]]
+        targets += [None] * (len(sections) - len(targets))
+
+    updates = []
+    inserts = []
+    unchanged = 0
+    for target_id, (section_title, html_content) in zip(targets, sections):
+        content_hash = section_content_hash(section_title, html_content)
+        if target_id is not None and hashes[target_id] == content_hash:
+            unchanged += 1
+            continue
+        plain_text, token_count = section_text_fields(html_content)
+        row = (section_title, html_content, plain_text, token_count, content_hash)
+        if target_id is not None:
+            updates.append((target_id, *row))
+        else:
+            inserts.append(row)
+    kept = set(targets)
+    deleted_ids = [section_id for section_id in hashes if section_id not in kept]
+
+    if deleted_ids:
+        cur.execute("DELETE FROM article_sections WHERE id = ANY(%s)", (deleted_ids,))
+
+    if updates:
+        execute_values(cur, """
+            UPDATE article_sections AS s
+            SET section_title = v.section_title,
+                html_content = v.html_content,
+                plain_text = v.plain_text,
+                token_count = v.token_count,
+                content_hash = v.content_hash
+            FROM (VALUES %s) AS v (id, section_title, html_content, plain_text, token_count, content_hash)
+            WHERE s.id = v.id
+        """, updates)
+        cur.execute("DELETE FROM article_section_chunks WHERE section_id = ANY(%s)", ([row[0] for row in updates],))
+
+    inserted_ids = []
+    if inserts:
+        # id выделяем заранее, чтобы новые разделы шли после существующих в том же порядке
+        cur.execute("""
+            SELECT nextval(pg_get_serial_sequence('article_sections', 'id')) AS id
+            FROM generate_series(1, %s)
+        """, (len(inserts),))
+        inserted_ids = [row["id"] for row in cur.fetchall()]
+        execute_values(cur, """
+            INSERT INTO article_sections (id, article_id, section_title, html_content, plain_text, token_count, content_hash)
+            VALUES %s
+        """, [(section_id, article_id, *row) for section_id, row in zip(inserted_ids, inserts)])
+
+    # Фрагменты для поиска пересобираем только у записанных разделов
+    written = [(row[0], row[3]) for row in updates] + [
+        (section_id, row[2]) for section_id, row in zip(inserted_ids, inserts)
+    ]
+    chunk_rows = [
+        (section_id, article_id, index, content, chunk_tokens)
+        for section_id, plain_text in written
+        for index, (content, chunk_tokens) in enumerate(split_into_chunks(plain_text))
+    ]
+    if chunk_rows:
+        execute_values(cur, """
+            INSERT INTO article_section_chunks (section_id, article_id, chunk_index, content, token_count)
+            VALUES %s
+        """, chunk_rows)
+
+    if updates or inserts or deleted_ids:
+        cur.execute("UPDATE articles SET updated_at = NOW() WHERE id = %s", (article_id,))
+
+    return {
+        "unchanged": unchanged,
+        "updated": len(updates),
+        "inserted": len(inserts),
+        "deleted": len(deleted_ids),
+        "updated_ids": [row[0] for row in updates],
+        "inserted_ids": inserted_ids,
+        "deleted_ids": deleted_ids,
+    }
@@ -1,19 +1,29 @@
 import os
+import asyncio
+import base64
+import json
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 from typing import Optional
-from contextlib import contextmanager
 from fastapi import Query
 import traceback
 from pydantic import BaseModel, EmailStr
 from fastapi import Body
-from fastapi import Response
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from fastapi import APIRouter, Body
+from anyio import from_thread
+import db
+from db import DATABASE_URL, db_pool, get_cursor, replace_section_chunks, sync_article_medical_sections
+from cache import TTLCache
+from http_cache import cache_headers, is_not_modified, not_modified, payload_etag
+from ingest import sync_article_sections
+from text_utils import (
+    TOKENIZER_LOAD_TIMEOUT, load_encoding, section_content_hash, section_text_fields, use_token_estimate
+)
 
 load_dotenv()
 
@@ -54,15 +64,38 @@ class Article(BaseModel):
 
 class PaginatedArticles(BaseModel):
     items: List[Article]
-    total: int
-    page: int
+    total: Optional[int]
+    page: Optional[int]
     per_page: int
+    next_cursor: Optional[str] = None
 
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL не задан в .env")
 
+# Точное количество статей по набору фильтров кэшируется на короткое время
+ARTICLES_COUNT_CACHE_TTL = float(os.getenv("ARTICLES_COUNT_CACHE_TTL", "30"))
+articles_count_cache = TTLCache(maxsize=512, ttl=ARTICLES_COUNT_CACHE_TTL)
+
+
+def encode_articles_cursor(last_id: int, rank: Optional[float] = None) -> str:
+    data = {"after_id": last_id}
+    if rank is not None:
+        data["rank"] = rank
+    payload = json.dumps(data).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_articles_cursor(cursor: str):
+    """Возвращает (after_id, rank); rank есть только у курсоров поисковой выдачи"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        rank = data.get("rank")
+        return int(data["after_id"]), float(rank) if rank is not None else None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
 
 
 
@@ -76,14 +109,21 @@ from pydantic import BaseModel
 class AskAIRequest(BaseModel):
     question: str
 
-from assistant.chat import answer_user_question
+from assistant.chat import answer_user_question, stream_user_answer
+from assistant.answer_cache import answer_cache
+from assistant.hybrid_search import hybrid_search, retrieval_stats
+from assistant.llm import llm_gateway
+from assistant.prompt_budget import prompt_stats
+from assistant.title_index import (
+    TITLE_INDEX_ENABLED, TITLE_INDEX_REFRESH_INTERVAL, run_refresh_loop, title_index
+)
 
 @router.post("/ask-ai")
 async def ask_ai(request: AskAIRequest):
     print(f"Получен запрос: {request.question}")
     try:
         print("Начинаем обработку запроса...")
-        answer = answer_user_question(request.question, app.state.db_conn)
+        answer = await answer_user_question(request.question, db.async_db_pool)
         print(f"Получен ответ: {answer[:100]}...")
         return {"answer": answer}
     except Exception as e:
@@ -92,44 +132,100 @@ async def ask_ai(request: AskAIRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/ask-ai/stream")
+async def ask_ai_stream(request: AskAIRequest):
+    """Тот же ответ, что и /ask-ai, но по мере генерации в формате Server-Sent Events"""
+    print(f"Получен потоковый запрос: {request.question}")
+
+    async def events():
+        async for event, data in stream_user_answer(request.question, db.async_db_pool):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/ask-ai/search")
+async def ask_ai_search(request: AskAIRequest, limit: int = Query(5, ge=1, le=50)):
+    """Статьи гибридного поиска с оценками и временем каждого этапа"""
+    async with db.async_db_pool.acquire() as conn:
+        articles, timings = await hybrid_search(request.question, conn, limit=limit)
+    return {"articles": articles, "timings_ms": timings}
+
+
+# Статистика читается в event loop, где ее и пишут, а не в пуле потоков
+@router.get("/ask-ai/retrieval-stats")
+async def ask_ai_retrieval_stats():
+    return retrieval_stats.stats()
+
+
+@router.get("/ask-ai/llm-stats")
+def ask_ai_llm_stats():
+    return {**llm_gateway.stats(), "prompt": prompt_stats.stats()}
+
+
+@router.get("/ask-ai/cache-stats")
+def ask_ai_cache_stats():
+    return answer_cache.stats()
+
+
+# Индекс меняет run_refresh_loop в event loop; в пуле потоков обход словарей мог бы упасть
+@router.get("/ask-ai/index-stats")
+async def ask_ai_index_stats():
+    return title_index.stats()
+
 app.include_router(router)
 
 
 @app.on_event("startup")
 def startup_db():
-    app.state.db_conn = psycopg2.connect(
-        dsn=DATABASE_URL,
-        cursor_factory=RealDictCursor
-    )
-    print("✅ Подключение к БД установлено")
+    db_pool.open()
+    print(f"✅ Пул соединений с БД открыт (min={db_pool.min_size}, max={db_pool.max_size})")
 
 @app.on_event("shutdown")
 def shutdown_db():
-    app.state.db_conn.close()
-    print("⛔ Подключение к БД закрыто")
+    db_pool.close()
+    print("⛔ Пул соединений с БД закрыт")
+
+@app.on_event("startup")
+async def startup_tokenizer():
+    # Словарь грузим заранее в потоке: при первом запросе загрузка остановила бы event loop
+    try:
+        await asyncio.wait_for(asyncio.to_thread(load_encoding), TOKENIZER_LOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        use_token_estimate(f"загрузка дольше {TOKENIZER_LOAD_TIMEOUT:g} сек")
+
+@app.on_event("startup")
+async def startup_async_db():
+    await db.open_async_pool()
+    print("✅ Асинхронный пул соединений с БД открыт")
+
+    if TITLE_INDEX_ENABLED:
+        async with db.async_db_pool.acquire() as conn:
+            await title_index.build(conn)
+        app.state.title_index_task = asyncio.create_task(
+            run_refresh_loop(title_index, db.async_db_pool, TITLE_INDEX_REFRESH_INTERVAL)
+        )
+
+@app.on_event("shutdown")
+async def shutdown_async_db():
+    task = getattr(app.state, "title_index_task", None)
+    if task:
+        task.cancel()
+    await db.close_async_pool()
 
 @app.get("/ping")
 def ping():
     return {"status": "ok"}
 
 
-
-@contextmanager
-def get_cursor():
-    conn = psycopg2.connect(
-        dsn=DATABASE_URL,
-        cursor_factory=RealDictCursor
-    )
-    try:
-        cursor = conn.cursor()
-        yield cursor
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cursor.close()
-        conn.close()
+@app.get("/pool-stats")
+def pool_stats():
+    return {"sync": db_pool.stats(), "async": db.async_pool_stats()}
 
 
 @app.get("/routes-debug")
@@ -159,22 +255,41 @@ def get_versions():
 
 @app.get("/articles", response_model=PaginatedArticles)
 def get_articles(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
     section_ids: Optional[str] = None,
     versions: Optional[str] = None,
     is_archived: Optional[bool] = None,
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1, le=100)
+    per_page: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    after_id: Optional[int] = Query(None, ge=0),
+    with_total: str = Query("exact", pattern="^(exact|estimated|none)$")
 ):
+    # Курсорный режим: страница начинается сразу после after_id, OFFSET не используется
+    after_rank = None
+    if cursor:
+        after_id, after_rank = decode_articles_cursor(cursor)
+
     try:
         with get_cursor() as cur:
             filters = []
             params = []
 
+            # Статьи без привязки к разделам медицины в выдачу не попадают
             if section_ids:
                 id_list = [int(id) for id in section_ids.split(',')]
-                filters.append("ms.id = ANY(%s)")
+                filters.append("""EXISTS (
+                    SELECT 1 FROM article_medical_sections ams
+                    WHERE ams.article_id = a.id AND ams.section_id = ANY(%s)
+                )""")
                 params.append(id_list)
+            else:
+                filters.append("""EXISTS (
+                    SELECT 1 FROM article_medical_sections ams
+                    WHERE ams.article_id = a.id
+                )""")
 
             if versions:
                 versions_list = [v.strip() for v in versions.split(',') if v.strip()]
@@ -182,8 +297,12 @@ def get_articles(
                 params.append(tuple(versions_list))
 
             if search:
-                filters.append("(a.title ILIKE %s OR a.mkb ILIKE %s)")
-                params.extend([f"%{search}%"] * 2)
+                # Полнотекстовый поиск (GIN) плюс поиск по подстроке через триграммный индекс
+                filters.append(
+                    "(a.search_vector @@ websearch_to_tsquery('russian', %s)"
+                    " OR a.title ILIKE %s OR a.mkb ILIKE %s)"
+                )
+                params.extend([search, f"%{search}%", f"%{search}%"])
 
             if is_archived is not None:
                 filters.append("a.is_archived = %s")
@@ -193,42 +312,93 @@ def get_articles(
             where_sql = f"WHERE {where_clause}" if where_clause else ""
 
             # Считаем общее количество
-            count_sql = f"""
-                SELECT COUNT(DISTINCT a.id)
-                FROM articles a
-                CROSS JOIN unnest(string_to_array(a.medical_section, ',')) AS section_name
-                INNER JOIN medical_sections ms ON trim(ms.name) = trim(section_name)
-                {where_sql}
-            """
-            cur.execute(count_sql, params)
-            total = cur.fetchone()['count']
-
-            offset = (page - 1) * per_page
-
-            # Получаем сразу нужные статьи с фильтрацией и пагинацией
-            data_query = f"""
-                SELECT DISTINCT a.id, a.title, a.medical_section, a.version, a.mkb, a.is_archived, COALESCE(a.updated_at, a.created_at) AS updated_at
-                FROM articles a
-                CROSS JOIN unnest(string_to_array(a.medical_section, ',')) AS section_name
-                INNER JOIN medical_sections ms ON trim(ms.name) = trim(section_name)
-                {where_sql}
-                ORDER BY a.id
-                LIMIT %s OFFSET %s
-            """
-            cur.execute(data_query, params + [per_page, offset])
+            total = None
+            if with_total == "exact":
+                cache_key = (where_sql, repr(params))
+                total = articles_count_cache.get(cache_key)
+                if total is None:
+                    cur.execute(f"SELECT COUNT(*) FROM articles a {where_sql}", params)
+                    total = cur.fetchone()['count']
+                    articles_count_cache.set(cache_key, total)
+            elif with_total == "estimated":
+                # Оценка планировщика: без сканирования таблицы
+                cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM articles a {where_sql}", params)
+                plan = cur.fetchone()["QUERY PLAN"]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                total = int(plan[0]["Plan"]["Plan Rows"])
+
+            offset = 0 if after_id is not None else (page - 1) * per_page
+
+            # При поиске выдача сортируется по релевантности (курсор хранит rank и id);
+            # голый after_id без rank листает по id
+            ranked = bool(search) and (after_id is None or after_rank is not None)
+
+            if ranked:
+                keyset_sql = ""
+                keyset_params = []
+                if after_id is not None:
+                    keyset_sql = "WHERE a.rank < %s::real OR (a.rank = %s::real AND a.id > %s)"
+                    keyset_params = [after_rank, after_rank, after_id]
+
+                data_query = f"""
+                    SELECT * FROM (
+                        SELECT a.id, a.title, a.medical_section, a.version, a.mkb, a.is_archived, COALESCE(a.updated_at, a.created_at) AS updated_at,
+                               ts_rank(a.search_vector, websearch_to_tsquery('russian', %s)) AS rank
+                        FROM articles a
+                        {where_sql}
+                    ) a
+                    {keyset_sql}
+                    ORDER BY a.rank DESC, a.id
+                    LIMIT %s OFFSET %s
+                """
+                data_params = [search] + params + keyset_params + [per_page + 1, offset]
+            else:
+                page_sql = where_sql
+                data_params = list(params)
+                if after_id is not None:
+                    page_sql = f"{where_sql} AND a.id > %s" if where_sql else "WHERE a.id > %s"
+                    data_params.append(after_id)
+
+                # Получаем сразу нужные статьи с фильтрацией и пагинацией
+                data_query = f"""
+                    SELECT a.id, a.title, a.medical_section, a.version, a.mkb, a.is_archived, COALESCE(a.updated_at, a.created_at) AS updated_at
+                    FROM articles a
+                    {page_sql}
+                    ORDER BY a.id
+                    LIMIT %s OFFSET %s
+                """
+                data_params += [per_page + 1, offset]
+
+            cur.execute(data_query, data_params)
             items = cur.fetchall()
 
+            # Лишняя строка означает, что есть следующая страница
+            next_cursor = None
+            if len(items) > per_page:
+                items = items[:per_page]
+                last = items[-1]
+                next_cursor = encode_articles_cursor(last["id"], last["rank"] if ranked else None)
+
             for item in items:
                 if item["updated_at"]:
                     item["updated_at"] = item["updated_at"].strftime("%d.%m.%Y %H:%M:%S")
 
-            return {
+            result = {
                 "items": items,
                 "total": total,
-                "page": page,
-                "per_page": per_page
+                "page": page if after_id is None else None,
+                "per_page": per_page,
+                "next_cursor": next_cursor
             }
 
+        # Выдача собирается из нескольких статей, поэтому ETag считаем по самому ответу
+        etag = payload_etag(result)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
+        return result
+
 
     except Exception as e:
         print("❌ Ошибка:", e)
@@ -255,37 +425,67 @@ def create_article(data: dict = Body(...)):
             """, (title, version, medical_section, mkb, is_archived))
 
             result = cur.fetchone()
+            sync_article_medical_sections(cur, result["id"], medical_section)
+            articles_count_cache.clear()
             return dict(result)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def article_validators(cur, article_id: int):
+    """(ETag, Last-Modified) статьи без чтения html разделов; None, если статьи нет"""
+    cur.execute(
+        """
+        SELECT
+            COALESCE(a.updated_at, a.created_at)::timestamptz AS last_modified,
+            md5(format('%%L|%%L|%%L|%%L|%%L|%%L', a.title, a.mkb, a.version, a.medical_section, a.is_archived, (
+                SELECT string_agg(s.id || ':' || COALESCE(s.content_hash, ''), ',' ORDER BY s.id)
+                FROM article_sections s
+                WHERE s.article_id = a.id
+            ))) AS content_hash
+        FROM articles a
+        WHERE a.id = %s
+        """,
+        (article_id,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return f'"{row["content_hash"]}"', row["last_modified"]
+
+
 @app.get("/articles/{article_id}")
-def get_article_content(article_id: int):
+def get_article_content(article_id: int, request: Request, response: Response):
     try:
-        cur = app.state.db_conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                a.title,
-                a.mkb,
-                a.version,
-                a.medical_section,
-                a.is_archived,
-                s.id AS section_id,
-                s.html_content
-            FROM articles a
-            LEFT JOIN article_sections s ON a.id = s.article_id
-            WHERE a.id = %s
-            """,
-            (article_id,)
-        )
-        contents = cur.fetchall()
-        cur.close()
+        with get_cursor() as cur:
+            validators = article_validators(cur, article_id)
+            if not validators:
+                raise HTTPException(status_code=404, detail="Статья не найдена")
+            if is_not_modified(request, *validators):
+                return not_modified(*validators)
+
+            cur.execute(
+                """
+                SELECT
+                    a.title,
+                    a.mkb,
+                    a.version,
+                    a.medical_section,
+                    a.is_archived,
+                    s.id AS section_id,
+                    s.html_content
+                FROM articles a
+                LEFT JOIN article_sections s ON a.id = s.article_id
+                WHERE a.id = %s
+                """,
+                (article_id,)
+            )
+            contents = cur.fetchall()
 
         if not contents:
             raise HTTPException(status_code=404, detail="Статья не найдена")
 
+        response.headers.update(cache_headers(*validators))
         return {
             "title": contents[0]["title"],
             "mkb": contents[0]["mkb"],
@@ -300,6 +500,8 @@ def get_article_content(article_id: int):
                 for row in contents if row["html_content"]
             ]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ Ошибка:", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -321,31 +523,35 @@ class ArticleFullResponse(BaseModel):
 
 
 @app.get("/articles/{article_id}/full", response_model=ArticleFullResponse)
-def get_full_article(article_id: int):
+def get_full_article(article_id: int, request: Request, response: Response):
     try:
-        conn = app.state.db_conn
-        cur = conn.cursor()
-
-        cur.execute(
-            """
-            SELECT
-                a.id,
-                a.title,
-                a.mkb,
-                a.version,
-                a.medical_section,
-                a.is_archived,
-                s.id AS section_id,
-                s.section_title,
-                s.html_content
-            FROM articles a
-            LEFT JOIN article_sections s ON a.id = s.article_id
-            WHERE a.id = %s
-            ORDER BY s.id ASC
-            """,
-            (article_id,)
-        )
-        rows = cur.fetchall()
+        with get_cursor() as cur:
+            validators = article_validators(cur, article_id)
+            if not validators:
+                raise HTTPException(status_code=404, detail="Статья не найдена")
+            if is_not_modified(request, *validators):
+                return not_modified(*validators)
+
+            cur.execute(
+                """
+                SELECT
+                    a.id,
+                    a.title,
+                    a.mkb,
+                    a.version,
+                    a.medical_section,
+                    a.is_archived,
+                    s.id AS section_id,
+                    s.section_title,
+                    s.html_content
+                FROM articles a
+                LEFT JOIN article_sections s ON a.id = s.article_id
+                WHERE a.id = %s
+                ORDER BY s.id ASC
+                """,
+                (article_id,)
+            )
+            rows = cur.fetchall()
 
         if not rows:
             raise HTTPException(status_code=404, detail="Статья не найдена")
@@ -367,73 +573,79 @@ def get_full_article(article_id: int):
             ]
         }
 
-        conn.commit()
-        cur.close()
+        response.headers.update(cache_headers(*validators))
         return article
 
+    except HTTPException:
+        raise
     except Exception as e:
-        if cur:
-            cur.close()
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class ArticleSectionUpdate(BaseModel):
+    id: Optional[int] = None  # нет id - новый раздел
+    section_title: str
+    html_content: str
+
 class ArticleFullUpdate(BaseModel):
     title: str
     mkb: str
     version: str
     medical_section: str
     is_archived: Optional[bool] = None
-    sections: List[ArticleSection]
+    sections: List[ArticleSectionUpdate]
 
-@app.put("/articles/{article_id}/full")
-def update_full_article(article_id: int, data: ArticleFullUpdate = Body(...)):
+def invalidate_article_answers(article_id: int):
+    """Сброс кэша ответов ассистента после сохраненной правки.
+
+    Ошибку кэша (например, недоступный Redis) только логируем: правка уже
+    записана, а устаревшие ответы и так не найдутся - в ключе есть updated_at.
+    """
     try:
-        cur = app.state.db_conn.cursor()
+        from_thread.run(answer_cache.invalidate_article, article_id)
+    except Exception as e:
+        print(f"⚠️ Не удалось сбросить кэш ответов статьи {article_id}: {e}")
 
-        # Проверяем существование статьи
-        cur.execute(
-            "SELECT id FROM articles WHERE id = %s",
-            (article_id,)
-        )
-        if not cur.fetchone():
-            cur.close()
-            raise HTTPException(status_code=404, detail="Статья не найдена")
 
-        # Обновляем основную информацию статьи
-        cur.execute(
-            """
-            UPDATE articles
-            SET title = %s, 
-                mkb = %s, 
-                version = %s, 
-                medical_section = %s, 
-                is_archived = %s
-            WHERE id = %s
-            """,
-            (data.title, data.mkb, data.version, data.medical_section, data.is_archived, article_id)
-        )
+@app.put("/articles/{article_id}/full")
+def update_full_article(article_id: int, data: ArticleFullUpdate = Body(...)):
+    try:
+        with get_cursor() as cur:
+            # Проверяем существование статьи
+            cur.execute(
+                "SELECT id FROM articles WHERE id = %s",
+                (article_id,)
+            )
+            if not cur.fetchone():
+                raise HTTPException(status_code=404, detail="Статья не найдена")
+
+            # Обновляем основную информацию статьи
+            cur.execute(
+                """
+                UPDATE articles
+                SET title = %s, 
+                    mkb = %s, 
+                    version = %s, 
+                    medical_section = %s, 
+                    is_archived = %s,
+                    updated_at = NOW()
+                WHERE id = %s
+                """,
+                (data.title, data.mkb, data.version, data.medical_section, data.is_archived, article_id)
+            )
+            sync_article_medical_sections(cur, article_id, data.medical_section)
 
-        # Обновляем секции
-        if hasattr(data, 'sections'):
-            # Удаляем старые секции
-            cur.execute("DELETE FROM article_sections WHERE article_id = %s", (article_id,))
-
-            # Добавляем новые секции
-            for section in data.sections:
-                cur.execute(
-                    """
-                    INSERT INTO article_sections (article_id, section_title, html_content)
-                    VALUES (%s, %s, %s)
-                    """,
-                    (article_id, section.section_title, section.html_content)
-                )
+            # Переписываем только изменившиеся секции
+            changes = sync_article_sections(
+                cur, article_id,
+                [(section.section_title, section.html_content) for section in data.sections],
+                [section.id for section in data.sections],
+            )
 
-        app.state.db_conn.commit()
-        cur.close()
-        return {"status": "success", "article_id": article_id}
+        articles_count_cache.clear()
+        invalidate_article_answers(article_id)
+        return {"status": "success", "article_id": article_id, "sections": changes}
     except Exception as e:
-        app.state.db_conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -446,54 +658,59 @@ def logout(response: Response):
 @app.put("/articles/{article_id}/sections/{section_id}")
 def update_section(article_id: int, section_id: int, data: dict = Body(...)):
     try:
-        cur = app.state.db_conn.cursor()
+        with get_cursor() as cur:
+            # Проверяем существование секции
+            cur.execute(
+                """
+                SELECT id FROM article_sections
+                WHERE article_id = %s AND id = %s
+                """,
+                (article_id, section_id)
+            )
+            if not cur.fetchone():
+                raise HTTPException(status_code=404, detail="Секция не найдена")
 
-        # Проверяем существование секции
-        cur.execute(
-            """
-            SELECT id FROM article_sections
-            WHERE article_id = %s AND id = %s
-            """,
-            (article_id, section_id)
-        )
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Секция не найдена")
+            section_title = data.get('title') or data.get('section_title')
+            html_content = data.get('html_content')
 
-        section_title = data.get('title') or data.get('section_title')
-        html_content = data.get('html_content')
+            if not section_title or not html_content:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Отсутствуют обязательные поля title/section_title или html_content"
+                )
 
-        if not section_title or not html_content:
-            raise HTTPException(
-                status_code=400,
-                detail="Отсутствуют обязательные поля title/section_title или html_content"
+            # Обновляем секцию
+            plain_text, token_count = section_text_fields(html_content)
+            cur.execute(
+                """
+                UPDATE article_sections
+                SET section_title = %s,
+                    html_content = %s,
+                    plain_text = %s,
+                    token_count = %s,
+                    content_hash = %s
+                WHERE article_id = %s AND id = %s
+                RETURNING id, section_title, html_content
+                """,
+                (section_title, html_content, plain_text, token_count,
+                 section_content_hash(section_title, html_content), article_id, section_id)
             )
+            result = cur.fetchone()
+            replace_section_chunks(cur, section_id, article_id, plain_text)
+
+            # Обновляем updated_at у статьи, если он null, ставим created_at
+            cur.execute(
+                """
+                UPDATE articles
+                SET updated_at = COALESCE(NOW(), created_at)
+                WHERE id = %s RETURNING updated_at
+                """,
+                (article_id,)
+            )
+            updated_at_obj = cur.fetchone()["updated_at"]
+            updated_at_str = updated_at_obj.isoformat()  # делает строку с T и микросекундами
 
-        # Обновляем секцию
-        cur.execute(
-            """
-            UPDATE article_sections
-            SET section_title = %s,
-                html_content = %s
-            WHERE article_id = %s AND id = %s
-            RETURNING id, section_title, html_content
-            """,
-            (section_title, html_content, article_id, section_id)
-        )
-        result = cur.fetchone()
-
-        # Обновляем updated_at у статьи, если он null, ставим created_at
-        cur.execute(
-            """
-            UPDATE articles
-            SET updated_at = COALESCE(NOW(), created_at)
-            WHERE id = %s RETURNING updated_at
-            """,
-            (article_id,)
-        )
-        updated_at_obj = cur.fetchone()["updated_at"]
-        updated_at_str = updated_at_obj.isoformat()  # делает строку с T и микросекундами
-
-        app.state.db_conn.commit()
+        invalidate_article_answers(article_id)
 
         return {
             "id": result["id"],
@@ -503,19 +720,13 @@ def update_section(article_id: int, section_id: int, data: dict = Body(...)):
         }
 
     except Exception as e:
-        app.state.db_conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cur:
-            cur.close()
 
 
 @app.post("/articles/{article_id}/sections")
 def create_section(article_id: int, data: dict = Body(...)):
-    cur = None
     try:
         print("Полученные данные:", data)
-        cur = app.state.db_conn.cursor()
 
         section_title = data.get('title') or data.get('section_title')
         html_content = data.get('html_content', '')
@@ -523,22 +734,27 @@ def create_section(article_id: int, data: dict = Body(...)):
         if not section_title:
             raise HTTPException(status_code=400, detail="Отсутствует title/section_title")
 
-        cur.execute(
-            """
-            INSERT INTO article_sections (article_id, section_title, html_content)
-            VALUES (%s, %s, %s)
-            RETURNING id, section_title, html_content
-            """,
-            (article_id, section_title, html_content)
-        )
+        plain_text, token_count = section_text_fields(html_content)
+
+        with get_cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO article_sections (article_id, section_title, html_content, plain_text, token_count, content_hash)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id, section_title, html_content
+                """,
+                (article_id, section_title, html_content, plain_text, token_count,
+                 section_content_hash(section_title, html_content))
+            )
 
-        result = cur.fetchone()
+            result = cur.fetchone()
 
-        if not result:
-            app.state.db_conn.rollback()
-            raise HTTPException(status_code=500, detail="Ошибка вставки: пустой результат")
+            if not result:
+                raise HTTPException(status_code=500, detail="Ошибка вставки: пустой результат")
 
-        app.state.db_conn.commit()
+            replace_section_chunks(cur, result["id"], article_id, plain_text)
+            # Last-Modified статьи учитывает и добавление разделов
+            cur.execute("UPDATE articles SET updated_at = NOW() WHERE id = %s", (article_id,))
 
         return {
             "id": result["id"],
@@ -547,13 +763,8 @@ def create_section(article_id: int, data: dict = Body(...)):
         }
 
     except Exception as e:
-        if app.state.db_conn:
-            app.state.db_conn.rollback()
         print(f"Ошибка при создании секции: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка при создании секции")
-    finally:
-        if cur:
-            cur.close()
 
 
 class LoginRequest(BaseModel):
@@ -568,15 +779,12 @@ class RegisterRequest(BaseModel):
 
 @app.post("/login")
 def login(data: LoginRequest):
-    conn = psycopg2.connect(dsn=DATABASE_URL, cursor_factory=RealDictCursor)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, email, full_name, role, is_active, password FROM users WHERE email = %s",
-        (data.email,)
-    )
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_cursor() as cur:
+        cur.execute(
+            "SELECT id, email, full_name, role, is_active, password FROM users WHERE email = %s",
+            (data.email,)
+        )
+        user = cur.fetchone()
     if not user or user["password"] != data.password:
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
     if not user["is_active"]:
@@ -590,32 +798,26 @@ def login(data: LoginRequest):
 
 @app.post("/register")
 def register(data: RegisterRequest):
-    conn = psycopg2.connect(dsn=DATABASE_URL, cursor_factory=RealDictCursor)
-    cur = conn.cursor()
     try:
-        # Проверка уникальности email и телефона
-        cur.execute("SELECT id FROM users WHERE email = %s OR phone = %s", (data.email, data.phone))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail="Email или телефон уже зарегистрированы")
-
-        # Вставка нового пользователя
-        cur.execute(
-            """
-            INSERT INTO users (email, phone, password, full_name)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, email, full_name
-            """,
-            (data.email, data.phone, data.password, data.full_name)
-        )
-        user = cur.fetchone()
-        conn.commit()
+        with get_cursor() as cur:
+            # Проверка уникальности email и телефона
+            cur.execute("SELECT id FROM users WHERE email = %s OR phone = %s", (data.email, data.phone))
+            if cur.fetchone():
+                raise HTTPException(status_code=400, detail="Email или телефон уже зарегистрированы")
+
+            # Вставка нового пользователя
+            cur.execute(
+                """
+                INSERT INTO users (email, phone, password, full_name)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id, email, full_name
+                """,
+                (data.email, data.phone, data.password, data.full_name)
+            )
+            user = cur.fetchone()
         return user
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
 
 
 @app.get("/sections")
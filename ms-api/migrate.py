@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import os
+import glob
+import psycopg2
+from db import DATABASE_URL
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def main():
+    conn = psycopg2.connect(dsn=DATABASE_URL)
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+            name = os.path.basename(path)
+            if name in applied:
+                continue
+
+            print(f"🔄 Применяем миграцию {name}...")
+            with open(path, encoding="utf-8") as f:
+                cur.execute(f.read())
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+            conn.commit()
+            print(f"✅ Миграция {name} применена")
+
+        print("\n✅ База данных в актуальном состоянии")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка миграции: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
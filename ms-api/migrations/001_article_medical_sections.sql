@@ -0,0 +1,18 @@
+-- Нормализованная связь статья <-> раздел медицины вместо разбора строки
+-- articles.medical_section на каждом запросе
+CREATE TABLE IF NOT EXISTS article_medical_sections (
+    article_id INTEGER NOT NULL REFERENCES articles (id) ON DELETE CASCADE,
+    section_id INTEGER NOT NULL REFERENCES medical_sections (id) ON DELETE CASCADE,
+    PRIMARY KEY (article_id, section_id)
+);
+
+CREATE INDEX IF NOT EXISTS article_medical_sections_section_id_idx
+    ON article_medical_sections (section_id, article_id);
+
+-- Заполняем связи для уже существующих статей
+INSERT INTO article_medical_sections (article_id, section_id)
+SELECT DISTINCT a.id, ms.id
+FROM articles a
+CROSS JOIN unnest(string_to_array(a.medical_section, ',')) AS section_name
+INNER JOIN medical_sections ms ON trim(ms.name) = trim(section_name)
+ON CONFLICT DO NOTHING;
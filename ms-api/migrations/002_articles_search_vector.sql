@@ -0,0 +1,20 @@
+-- Полнотекстовый поиск по статьям: заголовок важнее МКБ, МКБ важнее раздела медицины
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE articles
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(mkb, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(medical_section, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS articles_search_vector_idx
+    ON articles USING GIN (search_vector);
+
+-- Триграммы для поиска по подстроке (ILIKE '%...%') в заголовке и коде МКБ
+CREATE INDEX IF NOT EXISTS articles_title_trgm_idx
+    ON articles USING GIN (title gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS articles_mkb_trgm_idx
+    ON articles USING GIN (mkb gin_trgm_ops);
@@ -0,0 +1,5 @@
+-- Готовый текст секции для ассистента: HTML разбирается один раз при записи, а не на каждом запросе.
+-- Существующие строки заполняются скриптом backfill_plain_text.py
+ALTER TABLE article_sections
+    ADD COLUMN IF NOT EXISTS plain_text TEXT,
+    ADD COLUMN IF NOT EXISTS token_count INTEGER;
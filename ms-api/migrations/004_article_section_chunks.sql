@@ -0,0 +1,18 @@
+-- Фрагменты секций для выбора контекста ассистента по вопросу.
+-- Существующие секции разбиваются скриптом backfill_plain_text.py
+CREATE TABLE IF NOT EXISTS article_section_chunks (
+    id SERIAL PRIMARY KEY,
+    section_id INTEGER NOT NULL REFERENCES article_sections (id) ON DELETE CASCADE,
+    article_id INTEGER NOT NULL REFERENCES articles (id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('russian', content)) STORED,
+    UNIQUE (section_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS article_section_chunks_article_id_idx
+    ON article_section_chunks (article_id);
+
+CREATE INDEX IF NOT EXISTS article_section_chunks_search_vector_idx
+    ON article_section_chunks USING GIN (search_vector);
@@ -0,0 +1,17 @@
+-- Хэш содержимого секции: парсер и API перезаписывают только изменившиеся секции
+ALTER TABLE article_sections
+    ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+UPDATE article_sections
+SET content_hash = md5(section_title || E'\n' || coalesce(html_content, ''))
+WHERE content_hash IS NULL;
+
+-- Состояние последней загрузки страницы статьи для условных запросов
+CREATE TABLE IF NOT EXISTS article_fetch_state (
+    article_id INTEGER PRIMARY KEY REFERENCES articles (id) ON DELETE CASCADE,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    changed_at TIMESTAMP
+);
@@ -0,0 +1,27 @@
+-- Состояние запусков парсеров: продолжение после сбоя, повтор ошибок и разбиение на воркеры
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    workers INTEGER NOT NULL DEFAULT 1,
+    worker_index INTEGER NOT NULL DEFAULT 0,
+    position INTEGER,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS crawl_runs_unfinished_idx
+    ON crawl_runs (kind, workers, worker_index)
+    WHERE finished_at IS NULL;
+
+ALTER TABLE article_fetch_state
+    ADD COLUMN IF NOT EXISTS status TEXT,
+    ADD COLUMN IF NOT EXISTS failures INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS last_error TEXT,
+    ADD COLUMN IF NOT EXISTS run_id INTEGER REFERENCES crawl_runs (id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS article_fetch_state_failed_idx
+    ON article_fetch_state (article_id)
+    WHERE status = 'failed';
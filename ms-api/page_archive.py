@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Каталог архива загруженных страниц; пустое значение отключает архив
+PAGE_ARCHIVE_PATH = os.getenv("PAGE_ARCHIVE_PATH", "./page_archive")
+# Сколько последних загрузок каждой страницы хранить
+PAGE_ARCHIVE_KEEP = int(os.getenv("PAGE_ARCHIVE_KEEP", "3"))
+
+TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+class PageArchive:
+    """Сжатые копии страниц: <path>/<sha1(url)[:2]>/<sha1(url)>/<время загрузки>.html.gz"""
+
+    def __init__(self, path: str = PAGE_ARCHIVE_PATH, keep: int = PAGE_ARCHIVE_KEEP):
+        self.path = path
+        self.keep = keep
+
+    def _url_dir(self, url: str) -> str:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key[:2], key)
+
+    def _versions(self, url: str):
+        try:
+            names = os.listdir(self._url_dir(url))
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.endswith(".html.gz"))
+
+    def save(self, url: str, body: bytes, fetched_at: datetime = None):
+        url_dir = self._url_dir(url)
+        os.makedirs(url_dir, exist_ok=True)
+
+        url_file = os.path.join(url_dir, "url.txt")
+        if not os.path.exists(url_file):
+            with open(url_file, "w", encoding="utf-8") as f:
+                f.write(url)
+
+        name = f"{(fetched_at or datetime.now()).strftime(TIME_FORMAT)}.html.gz"
+        target = os.path.join(url_dir, name)
+        tmp = f"{target}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(body)
+        os.replace(tmp, target)
+
+        for stale in self._versions(url)[:-self.keep]:
+            os.remove(os.path.join(url_dir, stale))
+
+    def latest(self, url: str):
+        """(время загрузки, тело страницы) последней копии или None"""
+        versions = self._versions(url)
+        if not versions:
+            return None
+        name = versions[-1]
+        with gzip.open(os.path.join(self._url_dir(url), name), "rb") as f:
+            body = f.read()
+        return datetime.strptime(name[:-len(".html.gz")], TIME_FORMAT), body
+
+
+page_archive = PageArchive() if PAGE_ARCHIVE_PATH else None
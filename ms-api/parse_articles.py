@@ -1,10 +1,13 @@
+import asyncio
 import os
-import requests
+import sys
 from bs4 import BeautifulSoup
-from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
 import psycopg2
 from dotenv import load_dotenv
+from crawl_state import finish_run, record_failure, save_position, shard_args, start_run
+from crawler import Crawler
+from ingest import upsert_articles
 
 load_dotenv()
 
@@ -12,14 +15,7 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL не задан в .env")
 
-conn = psycopg2.connect(
-    dsn=DATABASE_URL,
-    cursor_factory=RealDictCursor
-)
-cur = conn.cursor()
-
-base_url = "https://diseases.medelement.com"
-search_url = "https://diseases.medelement.com/search/load_data"
+search_path = "/search/load_data"
 
 params = {
     "searched_data": "diseases",
@@ -34,26 +30,18 @@ params = {
     "skip": 10
 }
 
-headers = {
-    "User-Agent": "Mozilla/5.0",
-    "Referer": "https://diseases.medelement.com/"
-}
-
-inserted = 0
+# Сколько страниц выдачи загружаем параллельно
+LISTING_WINDOW = int(os.getenv("LISTING_WINDOW", "8"))
 
-while True:
-    print(f"Загружаем с skip={params['skip']}")
-    res = requests.get(search_url, params=params, headers=headers)
-    soup = BeautifulSoup(res.text, "html.parser")
-    links = soup.select(".results-item__title-link")
 
-    if not links:
-        break
+def parse_listing(html: str, crawler: Crawler):
+    """Статьи со страницы выдачи: заголовок, ссылка, МКБ, раздел, версия, архивность"""
+    soup = BeautifulSoup(html, "html.parser")
+    articles = []
 
-    for link in links:
+    for link in soup.select(".results-item__title-link"):
         title = link.get_text(strip=True)
-        href = link.get("href")
-        full_url = base_url + href
+        full_url = crawler.url(link.get("href"))
 
         article = link.find_parent("article")
 
@@ -80,36 +68,99 @@ while True:
         # Определяем архивность
         is_archived = article.select_one('.results-item__value.results__archive') is not None
 
-        try:
-            cur.execute(
-                sql.SQL("""
-                        INSERT INTO articles (title, url, medical_section, version, mkb, is_archived)
-                        VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (url) DO
-                        UPDATE SET
-                            title = EXCLUDED.title,
-                            medical_section = EXCLUDED.medical_section,
-                            version = EXCLUDED.version,
-                            mkb = EXCLUDED.mkb,
-                            is_archived = EXCLUDED.is_archived,
-                            updated_at = CURRENT_TIMESTAMP
-                        """),
-                (title, full_url, medical_section, version, mkb, is_archived)
-            )
-
-            if cur.rowcount > 0:
-                inserted += 1
-                status = "Обновлено" if cur.statusmessage.startswith("UPDATE") else "Добавлено"
-                print(f"{status}: {title}")
-
+        articles.append({
+            "title": title,
+            "url": full_url,
+            "medical_section": medical_section,
+            "version": version,
+            "mkb": mkb,
+            "is_archived": is_archived,
+        })
+
+    return articles
+
+
+async def fetch_listing_page(crawler: Crawler, skip: int):
+    response = await crawler.fetch(search_path, params={**params, "skip": skip})
+    return parse_listing(response.text, crawler)
+
+
+async def crawl(conn, cur, run, workers: int = 1, worker_index: int = 0):
+    inserted = 0
+    # Окна выдачи делятся между воркерами по номеру: воркер i берет окна i, i + M, ...
+    window_number = run["position"] if run["position"] is not None else worker_index
+
+    async with Crawler() as crawler:
+        # Шаг skip - размер страницы выдачи, берем его с первой страницы
+        page_size = len(await fetch_listing_page(crawler, params["skip"]))
+        if not page_size:
+            print("⚠️ Выдача пуста")
+            return inserted
+        window_span = LISTING_WINDOW * page_size
+        print(f"📄 Статей на странице выдачи: {page_size}")
+
+        while True:
+            # Окно страниц загружаем параллельно
+            first_skip = params["skip"] + window_number * window_span
+            skips = [first_skip + i * page_size for i in range(LISTING_WINDOW)]
+            print(f"Загружаем с skip={skips[0]} по skip={skips[-1]}")
+            pages = await asyncio.gather(*(fetch_listing_page(crawler, page_skip) for page_skip in skips))
+
+            finished = False
+            window = []
+            for articles in pages:
+                # Пустая страница - выдача закончилась
+                if not articles:
+                    finished = True
+                    break
+                window.extend(articles)
+
+            # Все окно записываем одной пачкой вместе с позицией запуска
+            added, updated = upsert_articles(cur, window)
+            window_number += workers
+            save_position(cur, run["id"], window_number)
             conn.commit()
+            inserted += added + updated
+            print(f"Добавлено: {added}, обновлено: {updated}")
+
+            if finished:
+                break
 
+        print(f"📊 Запросов: {crawler.stats()}")
+
+    return inserted
+
+
+def main():
+    # --restart начинает обход выдачи заново, иначе продолжаем незавершенный запуск
+    restart = "--restart" in sys.argv
+    workers, worker_index = shard_args()
+
+    conn = psycopg2.connect(
+        dsn=DATABASE_URL,
+        cursor_factory=RealDictCursor
+    )
+    cur = conn.cursor()
+
+    try:
+        run = start_run(cur, "listing", workers, worker_index, restart)
+        conn.commit()
+        try:
+            inserted = asyncio.run(crawl(conn, cur, run, workers, worker_index))
         except Exception as e:
-            print(f"Ошибка при обработке {title}: {str(e)}")
             conn.rollback()
+            record_failure(cur, run["id"], str(e))
+            conn.commit()
+            print(f"\n❌ Ошибка: {str(e)}. Следующий запуск продолжит с сохраненной позиции")
+            raise
 
-    params["skip"] += len(links)
+        finish_run(cur, run["id"])
+        conn.commit()
+        print(f"\nУспешно загружено {inserted} статей")
+    finally:
+        cur.close()
+        conn.close()
 
-print(f"\nУспешно загружено {inserted} статей")
 
-cur.close()
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from bs4 import BeautifulSoup
 from psycopg2.extras import RealDictCursor
 import psycopg2
 from dotenv import load_dotenv
+from db import link_articles_to_medical_sections
 
 load_dotenv()
 
@@ -56,6 +57,10 @@ try:
                 print(f"Ошибка при добавлении {name}: {e}")
                 continue
 
+    # Статьи с новыми разделами сразу появляются в выдаче
+    linked = link_articles_to_medical_sections(cur)
+    print(f"Добавлено связей статей с разделами: {linked}")
+
     conn.commit()
     print("\nПарсинг завершен успешно")
 
@@ -1,12 +1,32 @@
-import requests
+import asyncio
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup, Tag
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
 from dotenv import load_dotenv
+from crawl_state import finish_run, record_failure, shard_args, start_run
+from crawler import Crawler
+from ingest import article_content_hash, replace_article_sections, sync_article_sections
+from page_archive import page_archive
 
 load_dotenv()
 
+# Сколько статей загружаем параллельно и записываем в БД одной пачкой
+SECTIONS_BATCH_SIZE = int(os.getenv("SECTIONS_BATCH_SIZE", "50"))
+
+# lxml строит дерево на C; без него остается встроенный html.parser
+try:
+    import lxml  # noqa: F401
+    DEFAULT_HTML_PARSER = "lxml"
+except ImportError:
+    DEFAULT_HTML_PARSER = "html.parser"
+HTML_PARSER = os.getenv("HTML_PARSER", DEFAULT_HTML_PARSER)
+# Процессы для разбора страниц, чтобы разбор не тормозил загрузку
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+
 
 def get_db_connection():
     return psycopg2.connect(
@@ -49,72 +69,220 @@ def clean_article_content(article: Tag) -> Tag:
     return article
 
 
-def parse_and_save_article(article_id: int, url: str, cursor) -> None:
-    try:
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.text, "html.parser")
+def parse_article_sections(article_id: int, html: str, parser: str = HTML_PARSER):
+    """Разделы статьи [(заголовок, html)]; None, если страница не похожа на статью"""
+    soup = BeautifulSoup(html, parser)
+
+    article = soup.find("article")
+    if not article:
+        print(f"❌ Статья {article_id}: не найден тег article")
+        return None
 
-        article = soup.find("article")
-        if not article:
-            print(f"❌ Статья {article_id}: не найден тег article")
-            return
+    # Очищаем контент
+    article = clean_article_content(article)
 
-        # Очищаем контент
-        article = clean_article_content(article)
+    # Находим все разделы
+    parsed = []
+    for section in article.find_all("section", class_="page-section"):
+        title = section.find("h2", class_="page-section__title")
+        title_text = title.get_text(strip=True) if title else "Без названия"
 
-        # Находим все разделы
-        sections = article.find_all("section", class_="page-section")
+        # Делаем все ссылки некликабельными
+        for a_tag in section.find_all("a"):
+            if a_tag.has_attr("href"):
+                del a_tag["href"]
 
-        # Удаляем старые разделы
-        cursor.execute(
-            "DELETE FROM article_sections WHERE article_id = %s",
-            (article_id,)
-        )
+        parsed.append((title_text, str(section)))
 
-        # Сохраняем новые разделы
-        for section in sections:
-            title = section.find("h2", class_="page-section__title")
-            title_text = title.get_text(strip=True) if title else "Без названия"
+    return parsed
 
-            # Делаем все ссылки некликабельными
-            for a_tag in section.find_all("a"):
-                if a_tag.has_attr("href"):
-                    del a_tag["href"]
 
-            html_content = str(section)
+def save_fetch_state(cursor, rows, run_id: int, fetched: bool = True):
+    """rows: (article_id, etag, last_modified, content_hash, changed, status, error); fetched=False - разбор архива"""
+    if not rows:
+        return
+    execute_values(cursor, f"""
+        INSERT INTO article_fetch_state AS f
+            (article_id, etag, last_modified, content_hash, changed_at, status, failures, last_error, run_id)
+        SELECT v.article_id, v.etag, v.last_modified, v.content_hash,
+               CASE WHEN v.changed THEN NOW() END,
+               v.status, CASE WHEN v.status = 'failed' THEN 1 ELSE 0 END, v.error, %s
+        FROM (VALUES %%s) AS v (article_id, etag, last_modified, content_hash, changed, status, error)
+        ON CONFLICT (article_id) DO UPDATE SET
+            etag = COALESCE(EXCLUDED.etag, f.etag),
+            last_modified = COALESCE(EXCLUDED.last_modified, f.last_modified),
+            content_hash = COALESCE(EXCLUDED.content_hash, f.content_hash),
+            fetched_at = {"NOW()" if fetched else "f.fetched_at"},
+            changed_at = COALESCE(EXCLUDED.changed_at, f.changed_at),
+            status = EXCLUDED.status,
+            failures = CASE WHEN EXCLUDED.status = 'failed' THEN f.failures + 1 ELSE 0 END,
+            last_error = EXCLUDED.last_error,
+            run_id = EXCLUDED.run_id
+    """ % int(run_id), rows, template="(%s::int, %s::text, %s::text, %s::text, %s::bool, %s::text, %s::text)")
 
-            cursor.execute("""
-                           INSERT INTO article_sections (article_id, section_title, html_content)
-                           VALUES (%s, %s, %s)
-                           """, (article_id, title_text, html_content))
 
-        print(f"✅ Статья {article_id}: обработано {len(sections)} разделов")
+async def fetch_article_page(crawler: Crawler, pool: ProcessPoolExecutor, article):
+    """Условный запрос страницы статьи, сохранение в архив и разбор в пуле процессов.
 
+    Возвращает (статус, etag, last_modified, разделы, ошибка); статус fetched, not_modified или failed.
+    """
+    headers = {}
+    if article['etag']:
+        headers["If-None-Match"] = article['etag']
+    if article['last_modified']:
+        headers["If-Modified-Since"] = article['last_modified']
+    try:
+        response = await crawler.fetch(article['url'], headers=headers)
     except Exception as e:
-        print(f"❌ Ошибка при обработке статьи {article_id}: {str(e)}")
-        raise
+        print(f"❌ Статья {article['id']}: ошибка загрузки ({e})")
+        return "failed", None, None, None, str(e)
+
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    if response.status_code == 304:
+        return "not_modified", etag, last_modified, None, None
+
+    if page_archive:
+        await asyncio.to_thread(page_archive.save, article['url'], response.content)
+    html = response.content.decode("utf-8", errors="replace")
+    sections = await asyncio.get_running_loop().run_in_executor(pool, parse_article_sections, article['id'], html)
+    return "fetched", etag, last_modified, sections, None
+
+
+async def load_archived_page(pool: ProcessPoolExecutor, article):
+    """Разбор последней сохраненной копии страницы без обращения к сайту"""
+    archived = await asyncio.to_thread(page_archive.latest, article['url'])
+    if archived is None:
+        return "missing", None, None, None, "Нет копии в архиве"
+    _, body = archived
+    html = body.decode("utf-8", errors="replace")
+    sections = await asyncio.get_running_loop().run_in_executor(pool, parse_article_sections, article['id'], html)
+    return "archived", None, None, sections, None
+
+
+def write_batch(cur, batch, results, summary, run_id: int, fetched: bool = True):
+    """Записывает разобранные страницы пачки: меняются только разделы с другим хэшем"""
+    new_articles = {}  # статьи без разделов записываем одним COPY
+    state_rows = []
+    for article, (status, etag, last_modified, sections, error) in zip(batch, results):
+        summary[status] += 1
+        if status == "not_modified":
+            state_rows.append((article['id'], etag, last_modified, None, False, "ok", None))
+            continue
+        if status in ("failed", "missing"):
+            state_rows.append((article['id'], None, None, None, False, status, error))
+            continue
+        if sections is None:
+            summary["failed"] += 1
+            state_rows.append((article['id'], etag, last_modified, None, False, "failed", "Не найден тег article"))
+            continue
+
+        content_hash = article_content_hash(sections)
+        changed = content_hash != article['content_hash']
+        if not changed:
+            summary["unchanged"] += 1
+        elif not article['has_sections']:
+            new_articles[article['id']] = sections
+            summary["updated"] += 1
+        else:
+            changes = sync_article_sections(cur, article['id'], sections)
+            if changes["updated"] or changes["inserted"] or changes["deleted"]:
+                summary["updated"] += 1
+                print(f"🔄 Статья {article['id']}: без изменений {changes['unchanged']}, обновлено {changes['updated']}, "
+                      f"добавлено {changes['inserted']}, удалено {changes['deleted']}")
+            else:
+                changed = False
+                summary["unchanged"] += 1
+        state_rows.append((article['id'], etag, last_modified, content_hash, changed, "ok", None))
+
+    replace_article_sections(cur, new_articles)
+    save_fetch_state(cur, state_rows, run_id, fetched)
+
+
+def select_articles(cur, run_id: int, workers: int = 1, worker_index: int = 0, retry_failed: bool = False):
+    """Статьи воркера, еще не обработанные в этом запуске; retry_failed - только упавшие"""
+    cur.execute(f"""
+        SELECT a.id, a.url, f.etag, f.last_modified, f.content_hash,
+               EXISTS (SELECT 1 FROM article_sections s WHERE s.article_id = a.id) AS has_sections
+        FROM articles a
+        LEFT JOIN article_fetch_state f ON f.article_id = a.id
+        WHERE a.url IS NOT NULL
+          AND a.id %% %s = %s
+          AND f.run_id IS DISTINCT FROM %s
+          {"AND f.status = 'failed'" if retry_failed else ""}
+        ORDER BY a.id
+    """, (workers, worker_index, run_id))
+    return cur.fetchall()
+
+
+async def crawl(conn, cur, pool: ProcessPoolExecutor, articles, run_id: int, from_archive: bool = False):
+    summary = dict.fromkeys(["fetched", "not_modified", "archived", "missing", "unchanged", "updated", "failed"], 0)
+
+    async with Crawler() as crawler:
+        for start in range(0, len(articles), SECTIONS_BATCH_SIZE):
+            batch = articles[start:start + SECTIONS_BATCH_SIZE]
+            if from_archive:
+                results = await asyncio.gather(*(load_archived_page(pool, article) for article in batch))
+            else:
+                results = await asyncio.gather(*(fetch_article_page(crawler, pool, article) for article in batch))
+
+            # Разделы и отметка об обработке статей пачки фиксируются одной транзакцией
+            write_batch(cur, batch, results, summary, run_id, fetched=not from_archive)
+            conn.commit()
+            print(f"📄 Обработано статей: {min(start + SECTIONS_BATCH_SIZE, len(articles))} из {len(articles)}")
+
+        if not from_archive:
+            print(f"📊 Запросов: {crawler.stats()}")
+
+    return summary
 
 
 def main():
+    # --from-archive разбирает сохраненные копии страниц без обращения к сайту
+    from_archive = "--from-archive" in sys.argv
+    # --retry-failed повторяет только статьи, упавшие в прошлых запусках
+    retry_failed = "--retry-failed" in sys.argv
+    # --restart начинает новый запуск, иначе продолжаем незавершенный
+    restart = "--restart" in sys.argv
+    workers, worker_index = shard_args()
+    if from_archive and not page_archive:
+        raise RuntimeError("Архив страниц отключен (PAGE_ARCHIVE_PATH пуст)")
+
+    kind = "sections_archive" if from_archive else "sections"
+    if retry_failed:
+        kind += "_retry"
+
     conn = get_db_connection()
     cur = conn.cursor()
 
     try:
-        # Получаем статьи из базы
-        cur.execute("SELECT id, url FROM articles WHERE url IS NOT NULL")
-        articles = cur.fetchall()
+        run = start_run(cur, kind, workers, worker_index, restart)
+        articles = select_articles(cur, run["id"], workers, worker_index, retry_failed)
+        conn.commit()
+        print(f"📄 Статей к обработке: {len(articles)}")
 
-        for article in articles:
-            print(f"📄 Обработка статьи {article['id']}...")
-            parse_and_save_article(article['id'], article['url'], cur)
+        started = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(PARSE_WORKERS) as pool:
+                summary = asyncio.run(crawl(conn, cur, pool, articles, run["id"], from_archive))
+        except Exception as e:
+            conn.rollback()
+            record_failure(cur, run["id"], str(e))
             conn.commit()
+            print(f"\n❌ Ошибка: {str(e)}. Следующий запуск продолжит с необработанных статей")
+            raise
+        elapsed = time.perf_counter() - started
+        finish_run(cur, run["id"])
+        conn.commit()
 
-        print("\n✅ Парсинг завершен успешно")
-
-    except Exception as e:
-        print(f"\n❌ Ошибка: {str(e)}")
-        conn.rollback()
+        if from_archive:
+            print(f"\n✅ Разбор архива завершен за {elapsed:.1f} сек: разобрано {summary['archived']}, "
+                  f"нет в архиве {summary['missing']}, без изменений {summary['unchanged']}, "
+                  f"обновлено {summary['updated']}, ошибок {summary['failed']}")
+        else:
+            print(f"\n✅ Парсинг завершен за {elapsed:.1f} сек: загружено {summary['fetched']}, "
+                  f"не изменились на сервере (304) {summary['not_modified']}, без изменений {summary['unchanged']}, "
+                  f"обновлено {summary['updated']}, ошибок {summary['failed']}")
     finally:
         cur.close()
         conn.close()
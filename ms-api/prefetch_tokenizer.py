@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Загрузка словаря токенизатора в TIKTOKEN_CACHE_DIR для работы без сети.
+
+python prefetch_tokenizer.py                    - скачать словарь (нужна сеть)
+python prefetch_tokenizer.py файл.tiktoken      - положить в кэш заранее скачанный файл
+"""
+import hashlib
+import os
+import shutil
+import sys
+from text_utils import TIKTOKEN_CACHE_DIR, TOKENIZER_ENCODING, count_tokens, load_encoding, tokenizer_name
+
+# Откуда tiktoken берет словари; имя файла в кэше - sha1 этого адреса
+ENCODINGS_URL = "https://openaipublic.blob.core.windows.net/encodings"
+
+
+def install_from_file(path: str):
+    blob_url = f"{ENCODINGS_URL}/{TOKENIZER_ENCODING}.tiktoken"
+    os.makedirs(TIKTOKEN_CACHE_DIR, exist_ok=True)
+    target = os.path.join(TIKTOKEN_CACHE_DIR, hashlib.sha1(blob_url.encode()).hexdigest())
+    shutil.copyfile(path, target)
+    print(f"📄 {path} -> {target}")
+
+
+def main():
+    if len(sys.argv) > 1:
+        install_from_file(sys.argv[1])
+
+    load_encoding()
+    if tokenizer_name() != TOKENIZER_ENCODING:
+        sys.exit(1)
+
+    sample = "Гингивит - воспаление слизистой оболочки десны."
+    print(f"✅ Словарь {TOKENIZER_ENCODING} в {TIKTOKEN_CACHE_DIR}: «{sample}» = {count_tokens(sample)} токенов")
+
+
+if __name__ == "__main__":
+    main()
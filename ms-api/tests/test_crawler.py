@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/test")
+
+import parse_articles
+from crawler import Crawler
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+BASE_URL = "https://diseases.test"
+
+with open(os.path.join(FIXTURES, "listing_page.html"), encoding="utf-8") as f:
+    LISTING_PAGE = f.read()
+LISTING_PAGE_SIZE = LISTING_PAGE.count("results-item__title-link")
+
+
+def listing_transport(total_pages):
+    """Выдача из total_pages копий сохраненной страницы, дальше - пустые страницы"""
+    requested = []
+
+    def handler(request):
+        skip = int(request.url.params["skip"])
+        requested.append(skip)
+        page = (skip - parse_articles.params["skip"]) // LISTING_PAGE_SIZE
+        if page >= total_pages:
+            return httpx.Response(200, text="<div class=\"results\"></div>")
+        # Разные ссылки на каждой странице, чтобы статьи не совпадали по url
+        return httpx.Response(200, text=LISTING_PAGE.replace('href="/ru/', f'href="/ru/{page}-'))
+
+    return httpx.MockTransport(handler), requested
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+
+def run_crawl(monkeypatch, transport, window=8):
+    windows = []
+    monkeypatch.setattr(parse_articles, "LISTING_WINDOW", window)
+    monkeypatch.setattr(parse_articles, "Crawler",
+                        lambda: Crawler(base_url=BASE_URL, rate_limit=0, backoff_base=0, transport=transport))
+    monkeypatch.setattr(parse_articles, "upsert_articles", lambda cur, articles: (windows.append(articles) or (len(articles), 0)))
+    monkeypatch.setattr(parse_articles, "save_position", lambda cur, run_id, position: None)
+
+    inserted = asyncio.run(parse_articles.crawl(FakeConnection(), None, {"id": 1, "position": None}))
+    return inserted, windows
+
+
+def test_parse_listing_fields():
+    crawler = Crawler(base_url=BASE_URL)
+    articles = parse_articles.parse_listing(LISTING_PAGE, crawler)
+    asyncio.run(crawler.close())
+
+    assert [article["title"] for article in articles] == ["Гингивит", "Пародонтит", "Кариес зубов"]
+    assert articles[0]["url"] == f"{BASE_URL}/ru/гингивит-кп-рк-2020"
+    assert articles[0]["mkb"] == "K05.0, K05.1"
+    assert articles[1]["medical_section"] == "Стоматология, Челюстно-лицевая хирургия"
+    assert articles[0]["version"] == "Клинические протоколы МЗ РК - 2020"
+    assert [article["is_archived"] for article in articles] == [False, False, True]
+
+
+def test_crawl_uses_page_size_of_first_page(monkeypatch):
+    transport, requested = listing_transport(total_pages=5)
+    inserted, windows = run_crawl(monkeypatch, transport, window=2)
+
+    # Шаг skip равен числу статей на странице (3), а не прежним 10
+    first_skip = parse_articles.params["skip"]
+    assert sorted(set(requested)) == [first_skip + page * LISTING_PAGE_SIZE for page in range(6)]
+    assert inserted == 5 * LISTING_PAGE_SIZE
+    urls = [article["url"] for window in windows for article in window]
+    assert len(urls) == len(set(urls))
+
+
+def test_crawl_stops_on_empty_page(monkeypatch):
+    transport, requested = listing_transport(total_pages=3)
+    inserted, windows = run_crawl(monkeypatch, transport)
+
+    assert inserted == 3 * LISTING_PAGE_SIZE
+    assert len(windows) == 1
+    assert max(requested) < parse_articles.params["skip"] + 8 * LISTING_PAGE_SIZE
+
+
+def test_crawl_of_empty_listing(monkeypatch):
+    transport, _ = listing_transport(total_pages=0)
+    inserted, windows = run_crawl(monkeypatch, transport)
+
+    assert inserted == 0
+    assert windows == []
+
+
+def test_fetch_retries_503_then_raises_404():
+    statuses = iter([503, 404])
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(next(statuses))
+
+    async def fetch():
+        async with Crawler(base_url=BASE_URL, rate_limit=0, backoff_base=0,
+                           transport=httpx.MockTransport(handler)) as crawler:
+            with pytest.raises(httpx.HTTPStatusError) as error:
+                await crawler.fetch("/ru/missing")
+            return error.value.response.status_code, crawler.stats()
+
+    status, stats = asyncio.run(fetch())
+    assert status == 404
+    assert calls == ["/ru/missing", "/ru/missing"]
+    assert stats["retries"] == 1
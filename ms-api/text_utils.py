@@ -0,0 +1,165 @@
+import hashlib
+import os
+import re
+import threading
+from bs4 import BeautifulSoup
+
+# Теги, после которых в тексте начинается новая строка
+BLOCK_TAGS = [
+    "p", "div", "section", "article", "li", "ul", "ol", "table", "tr",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre",
+]
+
+# Кодировка токенизатора gpt-4o / gpt-4o-mini
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# Словарь токенизатора берется из этого каталога; заполняется заранее: python prefetch_tokenizer.py
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache"))
+os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+# 1 - не запускаться без токенизатора, иначе только громкое предупреждение и оценка по длине текста
+TOKENIZER_REQUIRED = os.getenv("TOKENIZER_REQUIRED", "0") == "1"
+# Сколько API ждет загрузки словаря при старте (без кэша tiktoken скачивает его без таймаута)
+TOKENIZER_LOAD_TIMEOUT = float(os.getenv("TOKENIZER_LOAD_TIMEOUT", "10"))
+# Оценка для случая, когда словарь токенизатора недоступен
+CHARS_PER_TOKEN_ESTIMATE = 4.0
+# Размер фрагмента секции для поиска контекста ассистентом
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+
+SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def html_to_plain_text(html: str) -> str:
+    """Текст секции без разметки: по строке на блок, пробелы схлопнуты"""
+    if not html:
+        return ""
+    soup = BeautifulSoup(html, "html.parser")
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_before("\n")
+        tag.insert_after("\n")
+
+    lines = (" ".join(line.split()) for line in soup.get_text().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def use_token_estimate(reason):
+    """Переключает подсчет токенов на оценку по длине текста (или останавливает запуск)"""
+    global _encoding_failed
+    _encoding_failed = True
+    print(f"❌ Токенизатор {TOKENIZER_ENCODING} недоступен ({reason}). Токены считаются приблизительно "
+          f"(символы / {CHARS_PER_TOKEN_ESTIMATE:g}), для кириллицы это заметно неточно. "
+          f"Загрузите словарь в {TIKTOKEN_CACHE_DIR}: python prefetch_tokenizer.py")
+    if TOKENIZER_REQUIRED:
+        raise RuntimeError(f"Токенизатор {TOKENIZER_ENCODING} недоступен: {reason}")
+
+
+def load_encoding():
+    """Загружает словарь токенизатора один раз; в API вызывается при старте, вне event loop"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is not None or _encoding_failed:
+            return _encoding
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            use_token_estimate(e)
+            return None
+        print(f"✅ Токенизатор {TOKENIZER_ENCODING} загружен")
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    """Чем сейчас считаются токены: кодировка tiktoken или оценка по длине"""
+    return TOKENIZER_ENCODING if _encoding is not None else "estimate"
+
+
+def get_encoding():
+    if _encoding is None and not _encoding_failed:
+        return load_encoding()
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return max(1, round(len(text) / CHARS_PER_TOKEN_ESTIMATE))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def section_content_hash(section_title: str, html: str) -> str:
+    """md5 заголовка и HTML секции; совпадает с md5(section_title || E'\\n' || html_content) в SQL"""
+    return hashlib.md5(f"{section_title}\n{html or ''}".encode("utf-8")).hexdigest()
+
+
+def section_text_fields(html: str):
+    """plain_text и token_count, которые хранятся рядом с html_content секции"""
+    plain_text = html_to_plain_text(html)
+    return plain_text, count_tokens(plain_text)
+
+
+def _split_long_line(line: str, max_tokens: int):
+    """Делит длинную строку по предложениям, а слишком длинные предложения - по словам"""
+    pieces = []
+    for sentence in SENTENCE_END.split(line):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(), []
+        for word in words:
+            if current and count_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+def split_into_chunks(plain_text: str, max_tokens: int = CHUNK_MAX_TOKENS):
+    """Фрагменты (текст, число токенов) из целых строк plain_text, не длиннее max_tokens"""
+    chunks = []
+    current, current_tokens = [], 0
+
+    for line in (plain_text or "").splitlines():
+        line_tokens = count_tokens(line)
+        pieces = [line] if line_tokens <= max_tokens else _split_long_line(line, max_tokens)
+        for piece in pieces:
+            piece_tokens = line_tokens if len(pieces) == 1 else count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                text = "\n".join(current)
+                chunks.append((text, count_tokens(text)))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        text = "\n".join(current)
+        chunks.append((text, count_tokens(text)))
+    return chunks
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Начало текста из целых предложений, укладывающееся в max_tokens"""
+    kept = []
+    used = 0
+    for line in (text or "").splitlines():
+        parts = SENTENCE_END.split(line)
+        sentences = []
+        for sentence in parts:
+            sentence_tokens = count_tokens(sentence)
+            if used + sentence_tokens > max_tokens:
+                break
+            sentences.append(sentence)
+            used += sentence_tokens
+        if sentences:
+            kept.append(" ".join(sentences))
+        if len(sentences) < len(parts):
+            break
+    return "\n".join(kept)